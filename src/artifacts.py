@@ -0,0 +1,654 @@
+"""
+Content digests of the published artifacts, to skip work when nothing changed.
+
+For every JSON artifact the digest store keeps the digest of the data it was
+serialized from and the digest of the file itself. If the next run produces the
+same data and the file is untouched, the artifact is not serialized or written
+again. Artifacts that did change during this run are collected, so the
+pipeline can skip the sync and the publication when the set is empty. The
+outputs are not tracked on master, so in CI the files are missing at the start
+of every run; a missing file is written again but only counts as changed if
+its new bytes differ from the digest recorded when it was last written.
+
+The digests are stored in .cache/digests.json ($DIGEST_FILE).
+
+Price files are written by `write_price_artifacts`, which produces several
+artifacts (e.g. all prices and the OneHub-only subset) from one traversal of
+the merged prices. Every row is encoded once per format and streamed to the
+files that select it. Besides the indented JSON, which stays the default, it
+can write compact `.min.json` siblings ($OUTPUT_COMPACT=1) and gzip/zstd
+compressed copies of each file ($OUTPUT_COMPRESS=gzip,zstd).
+
+`write_price_shards` splits the prices into one file per channel_type plus a
+manifest listing each shard's row count, size and hash, so consumers can fetch
+only the channels they need.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from json.encoder import encode_basestring
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from lazy_import import lazy_import
+from metrics import inc, timed
+from price_entry import PriceEntry, to_json
+
+# orjson is optional, only used for the compact files
+orjson = lazy_import("orjson", optional=True)
+# zstandard is optional, only needed for .zst files
+zstandard = lazy_import("zstandard", optional=True)
+
+DIGEST_FILE = os.path.join(".cache", "digests.json")
+
+# write compact .min.json siblings of the price files
+OUTPUT_COMPACT = os.getenv("OUTPUT_COMPACT", "0").lower() in ("1", "true", "yes")
+# compressed copies to write next to each price file: gzip and/or zstd
+OUTPUT_COMPRESS = os.getenv("OUTPUT_COMPRESS", "")
+# encoder of the compact files: auto (orjson if installed), orjson or json
+JSON_ENCODER = os.getenv("JSON_ENCODER", "auto")
+
+# directory of the per-channel_type shards and their manifest
+PRICE_SHARD_DIR = os.getenv("PRICE_SHARD_DIR", "shards")
+SHARD_MANIFEST = "manifest.json"
+SHARD_MANIFEST_VERSION = 1
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+ZSTD_LEVEL = 19
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def json_digest(data) -> str:
+    """Digest of JSON data, independent of its formatting."""
+    canonical = json.dumps(
+        data, separators=(",", ":"), ensure_ascii=False, default=to_json
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def file_digest(file_path: str) -> Optional[str]:
+    """Digest of the file's bytes, or None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+class DigestStore:
+    """
+    Persistent name -> digest mapping.
+
+    Args:
+        file_path (str): Where the digests are stored.
+    """
+
+    def __init__(self, file_path: str = DIGEST_FILE):
+        self.file_path = file_path
+        self.changed: Set[str] = set()  # artifacts changed during this run
+        self._lock = threading.Lock()
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                self._digests: Dict[str, str] = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._digests = {}
+
+    def get(self, name: str) -> Optional[str]:
+        with self._lock:
+            return self._digests.get(name)
+
+    def put(self, digests: Dict[str, str]) -> None:
+        """Record digests and save the store."""
+        with self._lock:
+            self._digests.update(digests)
+            os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            tmp_path = f"{self.file_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._digests, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.file_path)
+
+    def mark_changed(self, name: str) -> None:
+        with self._lock:
+            self.changed.add(name)
+
+
+def _content_changed(
+    file_path: str, new_digest: str, current_digest: Optional[str], store: DigestStore
+) -> bool:
+    """
+    Whether `file_path` now holds different bytes than before this write, and
+    record it in `store` if so. A missing file is compared with its last
+    recorded digest.
+    """
+    if current_digest is None:
+        current_digest = store.get(f"file:{file_path}")
+    changed = new_digest != current_digest
+    if changed:
+        store.mark_changed(file_path)
+    return changed
+
+
+_default_store: Optional[DigestStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_digest_store() -> DigestStore:
+    """Return the process-wide digest store ($DIGEST_FILE, default .cache/digests.json)."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = DigestStore(os.getenv("DIGEST_FILE", DIGEST_FILE))
+    return _default_store
+
+
+@timed("write", artifact="json")
+def write_json_artifact(file_path: str, data, store: DigestStore = None) -> bool:
+    """
+    Write `data` as indented JSON, unless the file already holds exactly that.
+
+    Args:
+        file_path (str): The artifact to write.
+        data: The JSON data.
+        store (DigestStore, optional): Where the digests are kept (default: the
+            process-wide store).
+
+    Returns:
+        bool: Whether the file content changed; a missing file that is written
+        again with its last recorded content does not count.
+    """
+    store = store or get_digest_store()
+    data_digest = json_digest(data)
+    current_digest = file_digest(file_path)
+    if (
+        current_digest is not None
+        and store.get(f"data:{file_path}") == data_digest
+        and store.get(f"file:{file_path}") == current_digest
+    ):
+        print(f"{file_path} 未变化，跳过写入。")
+        return False
+
+    body = json.dumps(data, indent=2, ensure_ascii=False, default=to_json)
+    body = body.encode("utf-8")
+    new_digest = hashlib.sha256(body).hexdigest()
+    if new_digest != current_digest:
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        inc("bytes_written", len(body))
+        os.replace(tmp_path, file_path)
+    changed = _content_changed(file_path, new_digest, current_digest, store)
+    store.put({f"data:{file_path}": data_digest, f"file:{file_path}": new_digest})
+    return changed
+
+
+class PriceArtifact:
+    """
+    A price file written by `write_price_artifacts`.
+
+    Args:
+        file_path (str): Where the indented JSON is written.
+        select (Callable, optional): Predicate picking the rows of this file;
+            all rows if not given.
+    """
+
+    def __init__(self, file_path: str, select: Callable[[object], bool] = None):
+        self.file_path = file_path
+        self.select = select
+
+
+def compact_path(file_path: str) -> str:
+    """Path of the compact sibling of a JSON file: prices.json -> prices.min.json."""
+    root, ext = os.path.splitext(file_path)
+    return f"{root}.min{ext}"
+
+
+def _parse_compress(compress) -> List[str]:
+    if isinstance(compress, str):
+        compress = [name.strip().lower() for name in compress.split(",")]
+    methods = [name for name in compress or () if name]
+    for name in methods:
+        if name not in COMPRESSION_SUFFIXES:
+            raise ValueError(f"Unknown compression: {name}")
+        if name == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+    return methods
+
+
+def _use_orjson(encoder: str) -> bool:
+    if encoder == "orjson":
+        if orjson is None:
+            raise ValueError("JSON_ENCODER=orjson requires the orjson package")
+        return True
+    if encoder not in ("auto", "json"):
+        raise ValueError(f"Unknown JSON encoder: {encoder}")
+    return encoder == "auto" and orjson is not None
+
+
+def _encode_scalar(value) -> Optional[str]:
+    """JSON of a str/int/float as json.dumps writes it; None for anything else."""
+    value_type = type(value)
+    if value_type is str:
+        return encode_basestring(value)
+    if value_type is float and math.isfinite(value):
+        return float.__repr__(value)
+    if value_type is int:
+        return int.__repr__(value)
+    return None
+
+
+_PRETTY_FIELDS = (
+    ("model", '    {\n      "model": '),
+    ("type", ',\n      "type": '),
+    ("channel_type", ',\n      "channel_type": '),
+    ("input", ',\n      "input": '),
+    ("output", ',\n      "output": '),
+)
+
+
+def _pretty_row(row) -> str:
+    """
+    A row of the "data" array as `json.dumps(data, indent=2)` writes it.
+
+    Rows of known fields with a flat extra_ratios are assembled directly, which
+    is several times faster than the pure Python indenting encoder; anything
+    else goes through json.dumps.
+    """
+    if type(row) is PriceEntry and not row.extra:
+        parts = []
+        for field, prefix in _PRETTY_FIELDS:
+            encoded = _encode_scalar(getattr(row, field))
+            if encoded is None:
+                break
+            parts += (prefix, encoded)
+        else:
+            ratios = row.extra_ratios
+            if not isinstance(ratios, dict):
+                if ratios is None:
+                    parts.append(',\n      "extra_ratios": null')
+                elif "extra_ratios" in row:
+                    parts = None
+            elif not ratios:
+                parts.append(',\n      "extra_ratios": {}')
+            else:
+                separator = ',\n      "extra_ratios": {\n        '
+                for key, value in ratios.items():
+                    encoded = _encode_scalar(value)
+                    if type(key) is not str or encoded is None:
+                        parts = None
+                        break
+                    parts += (separator, encode_basestring(key), ": ", encoded)
+                    separator = ",\n        "
+                else:
+                    parts.append("\n      }")
+            if parts is not None:
+                parts.append("\n    }")
+                return "".join(parts)
+
+    body = json.dumps(row, indent=2, ensure_ascii=False, default=to_json)
+    return "    " + body.replace("\n", "\n    ")
+
+
+def _compact_row(row, use_orjson: bool) -> str:
+    if use_orjson:
+        return orjson.dumps(row, default=to_json).decode("utf-8")
+    return json.dumps(row, separators=(",", ":"), ensure_ascii=False, default=to_json)
+
+
+# (document start, row separator, document end, empty document) per format
+_DOCUMENT_PARTS = {
+    "pretty": ('{\n  "data": [\n', ",\n", "\n  ]\n}", '{\n  "data": []\n}'),
+    "compact": ('{"data":[', ",", "]}", '{"data":[]}'),
+}
+
+
+class _HashingWriter:
+    """File wrapper hashing the bytes written through it."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.hash.update(data)
+        self.size += len(data)
+        return self.raw.write(data)
+
+    def flush(self) -> None:
+        self.raw.flush()
+
+
+class _Sink:
+    """
+    One output file, streamed to a temporary file and hashed on the fly.
+
+    It replaces the file on `close` only if the new bytes differ.
+    """
+
+    def __init__(self, file_path: str, compression: Optional[str] = None):
+        self.file_path = file_path
+        self.tmp_path = f"{file_path}.tmp"
+        self._raw = open(self.tmp_path, "wb")
+        self._hashing = _HashingWriter(self._raw)
+        if compression == "gzip":
+            # no name and mtime, so equal content compresses to equal bytes
+            self._out = gzip.GzipFile(
+                filename="", mode="wb", fileobj=self._hashing, mtime=0
+            )
+        elif compression == "zstd":
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self._out = compressor.stream_writer(self._hashing, closefd=False)
+        else:
+            self._out = self._hashing
+        self._buffer: List[str] = []
+        self._buffered = 0
+
+    def write(self, text: str) -> None:
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self._buffered >= WRITE_BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buffer:
+            self._out.write("".join(self._buffer).encode("utf-8"))
+            self._buffer.clear()
+            self._buffered = 0
+
+    def close(self) -> str:
+        """Finish the file and return the digest of its bytes."""
+        self._flush()
+        if self._out is not self._hashing:
+            self._out.close()
+        self._raw.close()
+        inc("bytes_written", self._hashing.size)
+        return self._hashing.hash.hexdigest()
+
+    def abort(self) -> None:
+        self._raw.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def _output_files(
+    artifact: PriceArtifact, formats: List[str], compress: List[str]
+) -> List[tuple]:
+    """(file path, format, compression) of every file written for `artifact`."""
+    files = []
+    for fmt in formats:
+        path = (
+            artifact.file_path if fmt == "pretty" else compact_path(artifact.file_path)
+        )
+        files.append((path, fmt, None))
+        files += [(path + COMPRESSION_SUFFIXES[c], fmt, c) for c in compress]
+    return files
+
+
+@timed("write", artifact="prices")
+def write_price_artifacts(
+    prices: dict,
+    artifacts: Iterable[PriceArtifact],
+    compact: bool = None,
+    compress=None,
+    encoder: str = None,
+    store: DigestStore = None,
+) -> Dict[str, bool]:
+    """
+    Write several price files from a single pass over `prices["data"]`.
+
+    Every row is encoded once per format and streamed to each artifact whose
+    `select` accepts it. The indented files are byte-identical to
+    `json.dumps({"data": rows}, indent=2, ensure_ascii=False)`. Like
+    `write_json_artifact`, nothing is serialized if the data and all files are
+    the same as after the last write, and files whose bytes did not change are
+    left untouched.
+
+    Args:
+        prices (dict): Price data with the rows in "data".
+        artifacts (Iterable[PriceArtifact]): The files to write.
+        compact (bool, optional): Also write compact .min.json siblings
+            (default: $OUTPUT_COMPACT).
+        compress (str or list, optional): Compressed copies to add to each file,
+            "gzip" and/or "zstd" (default: $OUTPUT_COMPRESS).
+        encoder (str, optional): Encoder of the compact rows: "auto", "orjson" or
+            "json" (default: $JSON_ENCODER). The indented rows always use the
+            standard library so their formatting stays the same.
+        store (DigestStore, optional): Where the digests are kept (default: the
+            process-wide store).
+
+    Returns:
+        Dict[str, bool]: Whether each written file changed, by path (see
+        `write_json_artifact`).
+
+    Raises:
+        ValueError: If a compression or encoder is unknown or not installed.
+    """
+    artifacts = list(artifacts)
+    store = store or get_digest_store()
+    compact = OUTPUT_COMPACT if compact is None else compact
+    compress = _parse_compress(OUTPUT_COMPRESS if compress is None else compress)
+    use_orjson = _use_orjson(encoder or JSON_ENCODER)
+    formats = ["pretty", "compact"] if compact else ["pretty"]
+    outputs = [_output_files(artifact, formats, compress) for artifact in artifacts]
+
+    # the data digest covers the options, which change the files written
+    options = f"{'orjson' if use_orjson and compact else 'json'}:{','.join(formats)}"
+    data_digest = f"{json_digest(prices)}:{options}"
+    current = {path: file_digest(path) for files in outputs for path, _, _ in files}
+    if all(
+        store.get(f"data:{artifact.file_path}") == data_digest
+        and all(
+            current[path] is not None and store.get(f"file:{path}") == current[path]
+            for path, _, _ in files
+        )
+        for artifact, files in zip(artifacts, outputs)
+    ):
+        for artifact in artifacts:
+            print(f"{artifact.file_path} 未变化，跳过写入。")
+        return {path: False for path in current}
+
+    sinks = [
+        [(fmt, _Sink(path, compression)) for path, fmt, compression in files]
+        for files in outputs
+    ]
+    counts = [0] * len(artifacts)
+    try:
+        for row in prices["data"]:
+            encoded = {}
+            for index, artifact in enumerate(artifacts):
+                if artifact.select is not None and not artifact.select(row):
+                    continue
+                if not encoded:
+                    encoded["pretty"] = _pretty_row(row)
+                    if compact:
+                        encoded["compact"] = _compact_row(row, use_orjson)
+                for fmt, sink in sinks[index]:
+                    start, separator = _DOCUMENT_PARTS[fmt][:2]
+                    sink.write((separator if counts[index] else start) + encoded[fmt])
+                counts[index] += 1
+
+        digests = {}
+        for index, artifact in enumerate(artifacts):
+            for fmt, sink in sinks[index]:
+                _, _, end, empty = _DOCUMENT_PARTS[fmt]
+                sink.write(end if counts[index] else empty)
+                digests[sink.file_path] = sink.close()
+    except BaseException:
+        for artifact_sinks in sinks:
+            for _, sink in artifact_sinks:
+                sink.abort()
+        raise
+
+    changed = {}
+    for path, digest in digests.items():
+        if digest != current[path]:
+            os.replace(f"{path}.tmp", path)
+        else:
+            os.remove(f"{path}.tmp")
+        changed[path] = _content_changed(path, digest, current[path], store)
+    new_digests = {f"file:{path}": digest for path, digest in digests.items()}
+    for artifact in artifacts:
+        new_digests[f"data:{artifact.file_path}"] = data_digest
+    store.put(new_digests)
+    return changed
+
+
+def shard_file_name(channel_type) -> str:
+    """File name of the shard holding the prices of `channel_type`."""
+    return re.sub(r"[^\w.-]", "_", str(channel_type)) + ".json"
+
+
+def _load_manifest(manifest_path: str) -> Optional[dict]:
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _shards_unchanged(directory: str, manifest: Optional[dict]) -> bool:
+    if not manifest or manifest.get("version") != SHARD_MANIFEST_VERSION:
+        return False
+    return all(
+        file_digest(os.path.join(directory, shard["file"])) == shard["sha256"]
+        for shard in manifest["shards"]
+    )
+
+
+@timed("write", artifact="shards")
+def write_price_shards(
+    prices: dict,
+    directory: str = None,
+    source: str = "oneapi_prices.json",
+    store: DigestStore = None,
+) -> dict:
+    """
+    Write the prices as one file per channel_type plus a manifest.
+
+    The rows are expected in `sort_prices` order, so every shard is a
+    contiguous run of rows and the shards are listed in channel_type order.
+    Shards are formatted like the full price file. The manifest
+    (`manifest.json`) lists per shard its channel_type, file name, row count,
+    byte size and sha256; shards of channel types that no longer exist are
+    removed. Only files listed in the previous manifest are ever removed, so the
+    directory may be shared with other files.
+
+    Args:
+        prices (dict): Sorted price data with the rows in "data".
+        directory (str, optional): Where the shards are written
+            (default: $PRICE_SHARD_DIR, "shards").
+        source (str, optional): The full price file the shards are cut from,
+            recorded in the manifest.
+        store (DigestStore, optional): Where the digests are kept (default: the
+            process-wide store).
+
+    Returns:
+        dict: The manifest.
+
+    Raises:
+        ValueError: If two channel types map to the same shard file name, e.g.
+            1 and "1".
+    """
+    directory = directory or PRICE_SHARD_DIR
+    store = store or get_digest_store()
+    manifest_path = os.path.join(directory, SHARD_MANIFEST)
+    data_digest = json_digest(prices)
+    manifest = _load_manifest(manifest_path)
+    if (
+        store.get(f"shards:{directory}") == data_digest
+        and store.get(f"file:{manifest_path}") == file_digest(manifest_path)
+        and _shards_unchanged(directory, manifest)
+    ):
+        print(f"{directory} 分片未变化，跳过写入。")
+        return manifest
+
+    os.makedirs(directory, exist_ok=True)
+    start, separator, end, _ = _DOCUMENT_PARTS["pretty"]
+    shards: Dict[object, dict] = {}
+    sinks: Dict[object, _Sink] = {}
+    # file name -> channel type, the manifest name is taken
+    file_owners: Dict[str, object] = {SHARD_MANIFEST: None}
+    try:
+        for row in prices["data"]:
+            channel_type = row["channel_type"]
+            sink = sinks.get(channel_type)
+            if sink is None:
+                file_name = shard_file_name(channel_type)
+                if file_name in file_owners:
+                    raise ValueError(
+                        f"channel_type {channel_type!r} would be written to "
+                        f"{file_name}, which is taken by "
+                        + (
+                            "the manifest"
+                            if file_owners[file_name] is None
+                            else f"channel_type {file_owners[file_name]!r}"
+                        )
+                    )
+                file_owners[file_name] = channel_type
+                sink = sinks[channel_type] = _Sink(os.path.join(directory, file_name))
+                shards[channel_type] = {
+                    "channel_type": channel_type,
+                    "file": file_name,
+                    "rows": 0,
+                    "bytes": 0,
+                    "sha256": None,
+                }
+                sink.write(start)
+            elif shards[channel_type]["rows"]:
+                sink.write(separator)
+            sink.write(_pretty_row(row))
+            shards[channel_type]["rows"] += 1
+        for channel_type, sink in sinks.items():
+            sink.write(end)
+            shards[channel_type]["sha256"] = sink.close()
+    except BaseException:
+        for sink in sinks.values():
+            sink.abort()
+        raise
+
+    digests = {}
+    for shard in shards.values():
+        path = os.path.join(directory, shard["file"])
+        shard["bytes"] = os.path.getsize(f"{path}.tmp")
+        current_digest = file_digest(path)
+        if shard["sha256"] != current_digest:
+            os.replace(f"{path}.tmp", path)
+        else:
+            os.remove(f"{path}.tmp")
+        _content_changed(path, shard["sha256"], current_digest, store)
+        digests[f"file:{path}"] = shard["sha256"]
+
+    # 删除已不存在的渠道的分片，只删除上一版清单中列出的文件
+    previous_files = {
+        shard.get("file")
+        for shard in (manifest or {}).get("shards", [])
+        if isinstance(shard, dict)
+    }
+    for file_name in sorted(previous_files - set(file_owners), key=str):
+        # a hand-edited manifest must not point outside the directory
+        if not isinstance(file_name, str) or os.path.basename(file_name) != file_name:
+            continue
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+            store.mark_changed(path)
+
+    manifest = {
+        "version": SHARD_MANIFEST_VERSION,
+        "source": source,
+        "rows": sum(shard["rows"] for shard in shards.values()),
+        "shards": list(shards.values()),
+    }
+    write_json_artifact(manifest_path, manifest, store=store)
+    digests[f"shards:{directory}"] = data_digest
+    store.put(digests)
+    return manifest
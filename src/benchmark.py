@@ -0,0 +1,576 @@
+"""
+Offline benchmark of the price pipeline.
+
+Generates synthetic catalogs of a given size: a manual_prices YAML tree, the
+SiliconFlow and OpenRouter model lists, the MartialBE price list and the
+ownedby channels. They are served by a local stand-in HTTP server, which also
+plays OneHub's price API. The upstream URLs are pointed at the stand-in
+through $OWNEDBY_URL, $SILICONFLOW_URL, $OPENROUTER_URL and
+$MARTIALBE_PRICES_URL, so no network access is needed.
+
+For every size the benchmark times these stages, taking the best of
+`--repeat` runs:
+
+- fetch: download and decode all upstream sources
+- yaml_load: parse the manual YAML tree
+- convert_price: convert every manual price string
+- manual: compile the manual prices with an empty cache (yaml_to_json)
+- convert: convert the SiliconFlow and OpenRouter model lists
+- integrate: integrate_prices of the manual and SiliconFlow prices
+- merge: merge all sources (merge_price_sources)
+- serialize: write oneapi_prices.json and onehub_only_prices.json
+- sync: POST the merged prices to the stand-in OneHub
+- pipeline: the whole pipeline end to end, with a cold cache
+
+Output of the stages is discarded, so the per-model prints do not skew the
+timings with terminal I/O.
+
+Usage:
+    python src/benchmark.py [--sizes 1000 10000 100000] [--repeat 3]
+        [--stages fetch merge ...] [--output report.json]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+import yaml
+
+SIZES = (1000, 10000, 100000)
+STAGES = (
+    "fetch",
+    "yaml_load",
+    "convert_price",
+    "manual",
+    "convert",
+    "integrate",
+    "merge",
+    "serialize",
+    "sync",
+    "pipeline",
+)
+MODELS_PER_CHANNEL = 100  # manual models per channel (and per YAML file)
+FIRST_CHANNEL_ID = 2000  # ids of the synthetic channels, clear of the real ones
+ADMIN_TOKEN = "benchmark"
+
+OWNEDBY_PATH = "/api/ownedby"
+SILICONFLOW_PATH = "/api/v1/playground/comprehensive/all"
+OPENROUTER_PATH = "/api/v1/models"
+MARTIALBE_PATH = "/MartialBE/one-api/prices/prices.json"
+
+
+def channel_names(size: int) -> List[str]:
+    return [f"Provider {i}" for i in range(max(1, size // MODELS_PER_CHANNEL))]
+
+
+def make_ownedby(size: int) -> dict:
+    """ownedby payload with the real SiliconFlow/OpenRouter ids and the synthetic channels."""
+    channels = {45: "SiliconFlow", 20: "OpenRouter"}
+    for i, name in enumerate(channel_names(size)):
+        channels[FIRST_CHANNEL_ID + i] = name
+    return {
+        "data": {
+            str(channel_id): {"id": channel_id, "name": name, "icon": ""}
+            for channel_id, name in channels.items()
+        }
+    }
+
+
+def _price(rng: random.Random) -> str:
+    return f"{rng.uniform(0.01, 60):.4g}"
+
+
+def make_manual_prices(size: int, rng: random.Random) -> Dict[str, str]:
+    """
+    A manual_prices tree of `size` models, one YAML file per channel.
+
+    Every 5th model has an alias, every 7th extra_ratios and every 11th is
+    priced per call. Siliconflow.yaml and OpenRouter.yaml override some of the
+    synthetic SiliconFlow and OpenRouter models.
+
+    Returns:
+        Dict[str, str]: YAML text by file name.
+    """
+    files = {}
+    names = channel_names(size)
+    for channel_index, channel in enumerate(names):
+        models = {}
+        for j in range(MODELS_PER_CHANNEL):
+            i = channel_index * MODELS_PER_CHANNEL + j
+            if i >= size:
+                break
+            currency = "usd" if i % 2 else "rmb"
+            if i % 11 == 0:
+                info = {"input": f"{_price(rng)} {currency}", "output": 0}
+            else:
+                info = {
+                    "input": f"{_price(rng)} {currency} / M",
+                    "output": f"{_price(rng)} {currency} / M",
+                }
+            if i % 5 == 0:
+                info["aliases"] = [f"model-{i:06d}-latest"]
+            if i % 7 == 0:
+                info["extra_ratios"] = [{"cached_tokens": f"{_price(rng)} usd / M"}]
+            models[f"model-{i:06d}"] = info
+        files[f"{channel}.yaml"] = yaml.safe_dump(
+            {"models": {channel: models}}, allow_unicode=True, sort_keys=False
+        )
+    # manual overrides of the SiliconFlow and OpenRouter prices
+    for file_name, channel, prefix in (
+        ("Siliconflow.yaml", "SiliconFlow", "vendor0/sf-model-"),
+        ("OpenRouter.yaml", "OpenRouter", "org0/or-model-"),
+    ):
+        models = {
+            f"{prefix}{i:06d}": {
+                "input": f"{_price(rng)} usd / M",
+                "output": f"{_price(rng)} usd / M",
+            }
+            for i in range(0, min(size, 1000), 50)
+        }
+        files[file_name] = yaml.safe_dump(
+            {"models": {channel: models}}, allow_unicode=True, sort_keys=False
+        )
+    return files
+
+
+def make_siliconflow(size: int, rng: random.Random) -> dict:
+    """SiliconFlow playground payload of `size` models, mixing all price units."""
+    models = []
+    for i in range(size):
+        name = f"vendor{i % 50}/sf-model-{i:06d}"
+        if i % 4 == 0:
+            models.append(
+                {
+                    "modelName": name,
+                    "priceUnit": "/ M Tokens",
+                    "price": _price(rng),
+                    "pricing": [
+                        {"specification": "prompt", "price": _price(rng)},
+                        {"specification": "completion", "price": _price(rng)},
+                    ],
+                }
+            )
+        else:
+            unit = ("/ M Tokens", "/ M UTF-8 bytes", "/ Image", "")[i % 4]
+            models.append(
+                {
+                    "modelName": name,
+                    "priceUnit": unit,
+                    "price": _price(rng),
+                    "pricing": [],
+                }
+            )
+    return {"code": 0, "data": {"models": models}}
+
+
+def make_openrouter(size: int, rng: random.Random) -> dict:
+    """OpenRouter models payload of `size` models; every 50th has a variable price."""
+    models = []
+    for i in range(size):
+        prompt = "-1" if i % 50 == 0 else f"{rng.uniform(0, 6e-5):.3g}"
+        models.append(
+            {
+                "id": f"org{i % 40}/or-model-{i:06d}",
+                "name": f"OR model {i}",
+                "pricing": {
+                    "prompt": prompt,
+                    "completion": f"{rng.uniform(0, 1e-4):.3g}",
+                },
+            }
+        )
+    return {"data": models}
+
+
+def make_martialbe(size: int, rng: random.Random) -> list:
+    """
+    MartialBE price list of `size` rows. Half of them repeat manual models on
+    the same channel, so manual precedence has rows to override.
+    """
+    names = channel_names(size)
+    rows = []
+    for i in range(size):
+        channel_id = FIRST_CHANNEL_ID + (i // MODELS_PER_CHANNEL) % len(names)
+        model = f"model-{i:06d}" if i % 2 == 0 else f"upstream-{i:06d}"
+        rows.append(
+            {
+                "model": model,
+                "type": "tokens",
+                "channel_type": channel_id,
+                "input": round(rng.uniform(0, 30), 5),
+                "output": round(rng.uniform(0, 60), 5),
+            }
+        )
+    return rows
+
+
+class StandInServer:
+    """
+    Local HTTP server replaying the upstream sources and OneHub's price API.
+
+    GET requests for the paths in `routes` return the stored bytes, with an
+    ETag so conditional requests get 304s. GET /api/prices and POST
+    /api/prices/sync keep the synced prices in memory; ownedby sync calls are
+    accepted.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, bytes] = {}
+        self.prices: Dict[tuple, dict] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self) -> "StandInServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _sync(self, update_mode: str, rows: list) -> None:
+        with self._lock:
+            if update_mode == "overwrite":
+                self.prices = {}
+            for row in rows:
+                key = (row["model"], row["channel_type"])
+                if update_mode == "add" and key in self.prices:
+                    continue
+                if update_mode == "update" and key not in self.prices:
+                    continue
+                self.prices[key] = row
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes = b"", headers: dict = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, data) -> None:
+                self._send(200, json.dumps(data).encode("utf-8"))
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_GET(self):
+                stand_in.requests += 1
+                path = urlsplit(self.path).path
+                if path == "/api/prices":
+                    with stand_in._lock:
+                        prices = list(stand_in.prices.values())
+                    return self._json({"success": True, "data": prices})
+                if path.startswith("/api/model_ownedby"):
+                    return self._json({"success": True, "data": []})
+                body = stand_in.routes.get(path)
+                if body is None:
+                    return self._send(404, b"{}")
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", {"ETag": etag})
+                self._send(200, body, {"ETag": etag})
+
+            def do_POST(self):
+                stand_in.requests += 1
+                body = self._read_body()
+                url = urlsplit(self.path)
+                if url.path == "/api/prices/sync":
+                    update_mode = parse_qs(url.query).get("updateMode", ["update"])[0]
+                    stand_in._sync(update_mode, json.loads(body))
+                self._json({"success": True})
+
+            def do_DELETE(self):
+                stand_in.requests += 1
+                self._json({"success": True})
+
+        return Handler
+
+
+def configure_environment(server_url: str) -> None:
+    """Point every upstream and OneHub URL at the stand-in server."""
+    os.environ.update(
+        {
+            "OWNEDBY_URL": f"{server_url}{OWNEDBY_PATH}",
+            "SILICONFLOW_URL": server_url,
+            "OPENROUTER_URL": server_url,
+            "MARTIALBE_PRICES_URL": f"{server_url}{MARTIALBE_PATH}",
+            "SILICONFLOW_API_KEY": "benchmark",
+            "ONEHUB_URL": server_url,
+            "ONEHUB_ADMIN_TOKEN": ADMIN_TOKEN,
+            # measure the pipeline, not the per-host rate limit
+            "HTTP_RATE_LIMIT": "0",
+        }
+    )
+    os.environ.pop("ONEHUB_TARGETS", None)
+
+
+def _best_time(func: Callable[[], object], repeat: int, setup: Callable = None):
+    """Best wall time of `repeat` calls of `func`, and the last result."""
+    best, result = None, None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _reset_caches() -> None:
+    """Forget the process-wide caches, so the next run starts cold."""
+    import artifacts
+    import utils
+
+    shutil.rmtree(".cache", ignore_errors=True)
+    utils._manual_catalog = None
+    utils._channel_id_mapping = None
+    artifacts._default_store = None
+
+
+def benchmark_size(
+    server: StandInServer, size: int, stages: List[str], repeat: int, seed: int
+) -> dict:
+    """
+    Generate catalogs of `size` models in the current directory and time `stages`.
+
+    Returns:
+        dict: "rows" per source and "seconds" per stage.
+    """
+    # imported here, after configure_environment set the URLs they read
+    from artifacts import DigestStore, PriceArtifact, write_price_artifacts
+    from fetch import FetchRequest, fetch_all
+    from get_openrouter_prices import convert_openrouter_models
+    from get_siliconflow_prices import convert_siliconflow_models
+    from merge_prices import is_onehub_only_price
+    from pipeline import build_stages, run_stages
+    from price_entry import as_price_entries
+    from sync_pricing import sync_pricing
+    from utils import (
+        convert_price,
+        integrate_prices,
+        load_yaml_from_directory,
+        merge_price_sources,
+        remember_channel_id_mapping,
+        sort_models,
+        yaml_to_json,
+    )
+
+    rng = random.Random(seed)
+    ownedby = make_ownedby(size)
+    siliconflow = make_siliconflow(size, rng)
+    openrouter = make_openrouter(size, rng)
+    martialbe = make_martialbe(size, rng)
+    server.routes = {
+        OWNEDBY_PATH: json.dumps(ownedby).encode("utf-8"),
+        SILICONFLOW_PATH: json.dumps(siliconflow).encode("utf-8"),
+        OPENROUTER_PATH: json.dumps(openrouter).encode("utf-8"),
+        MARTIALBE_PATH: json.dumps(martialbe).encode("utf-8"),
+    }
+    os.makedirs("manual_prices", exist_ok=True)
+    for file_name, text in make_manual_prices(size, rng).items():
+        with open(os.path.join("manual_prices", file_name), "w", encoding="utf-8") as f:
+            f.write(text)
+    with open("ownedby_manual.json", "w", encoding="utf-8") as f:
+        json.dump(ownedby, f)
+
+    _reset_caches()
+    remember_channel_id_mapping(ownedby)
+    seconds = {}
+
+    def run(name: str, func: Callable[[], object], setup: Callable = None):
+        if name not in stages:
+            return None
+        seconds[name], result = _best_time(func, repeat, setup)
+        print(f"  {name:<14} {seconds[name] * 1000:10.1f} ms")
+        return result
+
+    def fetch_sources():
+        jobs = {
+            path: FetchRequest(f"{server.url}{path}", cache=False)
+            for path in server.routes
+        }
+        return {path: response.json() for path, response in fetch_all(jobs).items()}
+
+    run("fetch", fetch_sources)
+    yaml_data = run("yaml_load", lambda: load_yaml_from_directory("manual_prices"))
+    if yaml_data is None:
+        yaml_data = load_yaml_from_directory("manual_prices")
+    price_strings = [
+        str(info[field])
+        for models in yaml_data["models"].values()
+        for info in models.values()
+        for field in ("input", "output")
+        if field in info
+    ]
+    run("convert_price", lambda: [convert_price(price) for price in price_strings])
+
+    def manual_setup():
+        _reset_caches()
+        remember_channel_id_mapping(ownedby)
+
+    manual = run("manual", lambda: yaml_to_json("manual_prices"), manual_setup)
+    if manual is None:
+        manual = yaml_to_json("manual_prices")
+
+    def convert():
+        return (
+            convert_siliconflow_models(sort_models(siliconflow, "siliconflow")),
+            convert_openrouter_models(sort_models(openrouter, "openrouter")),
+        )
+
+    converted = run("convert", convert) or convert()
+    siliconflow_prices = {"data": converted[0]}
+    openrouter_prices = {"data": converted[1]}
+
+    run("integrate", lambda: integrate_prices(manual, siliconflow_prices))
+
+    def merge():
+        return merge_price_sources(
+            manual,
+            siliconflow_prices,
+            openrouter_prices,
+            {"data": as_price_entries(martialbe)},
+        )
+
+    merged = run("merge", merge) or merge()
+
+    def serialize():
+        write_price_artifacts(
+            merged,
+            [
+                PriceArtifact("oneapi_prices.json"),
+                PriceArtifact("onehub_only_prices.json", is_onehub_only_price),
+            ],
+            store=DigestStore(os.path.join(".cache", "benchmark_digests.json")),
+        )
+
+    run("serialize", serialize, lambda: shutil.rmtree(".cache", ignore_errors=True))
+    run(
+        "sync",
+        lambda: sync_pricing(
+            f"{server.url}/api/prices/sync", ADMIN_TOKEN, merged["data"], "overwrite"
+        ),
+    )
+
+    def pipeline():
+        _, failed = run_stages(build_stages(), retry_delay=0)
+        if failed:
+            name, error = next(iter(failed.items()))
+            raise RuntimeError(f"pipeline stage {name} failed: {error}") from error
+
+    def pipeline_setup():
+        _reset_caches()
+        server.prices = {}
+
+    run("pipeline", pipeline, pipeline_setup)
+
+    return {
+        "rows": {
+            "manual": len(manual["data"]),
+            "siliconflow": len(siliconflow_prices["data"]),
+            "openrouter": len(openrouter_prices["data"]),
+            "martialbe": len(martialbe),
+            "merged": len(merged["data"]),
+        },
+        "seconds": seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the price pipeline offline."
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=list(SIZES),
+        help="Catalog sizes in models (default: %(default)s).",
+    )
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=STAGES,
+        default=list(STAGES),
+        metavar="STAGE",
+        help=f"Stages to time (default: all of {', '.join(STAGES)}).",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="Runs per stage (default: %(default)s)."
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the synthetic catalogs."
+    )
+    parser.add_argument("--output", help="Write the report as JSON to this file.")
+    parser.add_argument(
+        "--workdir",
+        help="Where to generate the catalogs and outputs (default: a temporary "
+        "directory, removed afterwards).",
+    )
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "sizes": {},
+    }
+    cwd = os.getcwd()
+    with StandInServer() as server:
+        configure_environment(server.url)
+        for size in args.sizes:
+            workdir = os.path.join(args.workdir, str(size)) if args.workdir else None
+            if workdir:
+                os.makedirs(workdir, exist_ok=True)
+            else:
+                workdir = tempfile.mkdtemp(prefix=f"onehub-bench-{size}-")
+            print(f"{size} models ({workdir}):")
+            os.chdir(workdir)
+            try:
+                report["sizes"][str(size)] = benchmark_size(
+                    server, size, args.stages, args.repeat, args.seed
+                )
+            finally:
+                os.chdir(cwd)
+                if not args.workdir:
+                    shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
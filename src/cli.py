@@ -0,0 +1,173 @@
+"""
+Single entry point for the price scripts.
+
+    python src/cli.py <command> [args...]
+    python src/cli.py ownedby
+    python src/cli.py sync-pricing --json_file oneapi_prices.json
+    python src/cli.py pipeline --no-sync
+
+Each command runs the `main` of its script with the remaining arguments, and
+only that script is imported, so a short command does not pay for the modules
+of the others. requests, yaml, numpy, asyncio, dotenv and the other heavy
+dependencies are loaded on first use (see `lazy_import.py`);
+`python src/cli.py import-time` checks that importing a script stays below a
+time budget and loads none of them.
+"""
+
+import importlib
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# command -> (module, description)
+COMMANDS: Dict[str, Tuple[str, str]] = {
+    "pipeline": ("pipeline", "Run the whole price update pipeline."),
+    "ownedby": ("get_ownedby", "Refresh the channel id mapping and ownedby.json."),
+    "siliconflow": ("get_siliconflow_prices", "Convert the SiliconFlow prices."),
+    "openrouter": ("get_openrouter_prices", "Convert the OpenRouter prices."),
+    "merge": ("merge_prices", "Merge the price files into oneapi_prices.json."),
+    "sync-ownedby": ("sync_ownedby", "Sync ownedby entries to OneHub."),
+    "sync-pricing": ("sync_pricing", "Sync a price file to OneHub."),
+    "db": ("price_db", "Query the SQLite price export."),
+    "benchmark": ("benchmark", "Benchmark the pipeline offline."),
+    "import-time": ("cli", "Check the import time of the commands."),
+}
+
+# modules that must not be loaded just by importing a command
+HEAVY_MODULES = (
+    "requests",
+    "yaml",
+    "numpy",
+    "asyncio",
+    "orjson",
+    "zstandard",
+    "dotenv",
+)
+# import budget per command in milliseconds, measured in a fresh interpreter
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "100"))
+# commands whose own job needs the heavy modules anyway
+_IMPORT_TIME_SKIP = ("benchmark",)
+
+
+def _usage() -> str:
+    width = max(len(command) for command in COMMANDS)
+    lines = ["usage: cli.py <command> [args...]", "", "commands:"]
+    for command, (_, description) in COMMANDS.items():
+        lines.append(f"  {command:<{width}}  {description}")
+    return "\n".join(lines)
+
+
+def measure_import(module: str) -> Tuple[float, List[str]]:
+    """
+    Import `module` in a fresh interpreter.
+
+    Returns:
+        Tuple[float, List[str]]: The import time in milliseconds, and the heavy
+        modules it loaded.
+    """
+    code = (
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print((time.perf_counter() - start) * 1000)\n"
+        f"print(' '.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n"
+    )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(
+            None, [os.path.dirname(os.path.abspath(__file__)), env.get("PYTHONPATH")]
+        )
+    )
+    # the child must not write metrics or profiles of its own
+    for name in ("METRICS_TEXTFILE", "METRICS_REPORT", "PROFILE"):
+        env.pop(name, None)
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.splitlines()
+    return float(output[0]), output[1].split() if len(output) > 1 else []
+
+
+def check_import_time(
+    commands: List[str] = None, budget_ms: float = None, repeat: int = 3
+) -> bool:
+    """
+    Check that every command imports within `budget_ms` without heavy modules.
+
+    Args:
+        commands (List[str], optional): Commands to check (default: all but
+            benchmark).
+        budget_ms (float, optional): Allowed import time in milliseconds
+            (default: $IMPORT_TIME_BUDGET_MS, 100).
+        repeat (int, optional): Imports per command, the fastest one counts.
+
+    Returns:
+        bool: Whether all commands passed.
+    """
+    budget_ms = IMPORT_TIME_BUDGET_MS if budget_ms is None else budget_ms
+    commands = commands or [c for c in COMMANDS if c not in _IMPORT_TIME_SKIP]
+    passed = True
+    for command in commands:
+        module = COMMANDS[command][0]
+        runs = [measure_import(module) for _ in range(max(1, repeat))]
+        elapsed = min(ms for ms, _ in runs)
+        heavy = sorted({name for _, loaded in runs for name in loaded})
+        ok = elapsed <= budget_ms and not heavy
+        passed = passed and ok
+        note = f", loads {', '.join(heavy)}" if heavy else ""
+        print(f"{'ok  ' if ok else 'FAIL'} {command:<13} {elapsed:7.1f} ms{note}")
+    print(f"import budget: {budget_ms:g} ms")
+    return passed
+
+
+def main(argv: List[str] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(_usage())
+        return
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"cli.py: unknown command {command!r}\n\n{_usage()}", file=sys.stderr)
+        raise SystemExit(2)
+
+    if command == "import-time":
+        import argparse
+
+        parser = argparse.ArgumentParser(
+            prog="cli.py import-time", description=COMMANDS[command][1]
+        )
+        parser.add_argument(
+            "commands", nargs="*", help="Commands to check (default: all)."
+        )
+        parser.add_argument(
+            "--budget",
+            type=float,
+            default=IMPORT_TIME_BUDGET_MS,
+            help="Allowed import time in milliseconds (default: %(default)s).",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=3,
+            help="Imports per command, the fastest counts (default: %(default)s).",
+        )
+        args = parser.parse_args(args)
+        unknown = set(args.commands) - set(COMMANDS)
+        if unknown:
+            parser.error(f"unknown commands: {', '.join(sorted(unknown))}")
+        if not check_import_time(args.commands, args.budget, args.repeat):
+            raise SystemExit(1)
+        return
+
+    module = importlib.import_module(COMMANDS[command][0])
+    # the scripts parse sys.argv themselves
+    sys.argv = [f"cli.py {command}", *args]
+    module.main()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Concurrent fetch layer for the upstream price sources.
+
+All requests go through the shared client in `http_client`, so connections are
+pooled and reused and transient failures are retried per request. `fetch_all`
+runs a batch of requests on an asyncio event loop, with a per-host concurrency
+limit and a timeout on every request, so the latency of a batch is that of its
+slowest request rather than the sum of all of them.
+
+Requests made with `cache=True` are conditional GETs backed by the on-disk
+cache in `http_cache`.
+"""
+
+from typing import Dict, Iterator, Tuple, Union
+from urllib.parse import urlsplit
+
+import http_client
+from http_cache import get_http_cache
+from lazy_import import lazy_import
+from metrics import inc, span
+
+asyncio = lazy_import("asyncio")
+requests = lazy_import("requests")
+
+# (connect, read) timeout in seconds applied to every request
+DEFAULT_TIMEOUT: Tuple[float, float] = (10, 60)
+# maximum number of concurrent requests against a single host
+DEFAULT_HOST_LIMIT = 4
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class FetchRequest:
+    """A GET request to run as part of a `fetch_all` batch."""
+
+    def __init__(
+        self,
+        url: str,
+        headers: Dict[str, str] = None,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        cache: bool = False,
+    ):
+        self.url = url
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.cache = cache
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.url).netloc
+
+    def __repr__(self) -> str:
+        return f"FetchRequest({self.url!r})"
+
+
+def fetch(
+    url: str,
+    headers: Dict[str, str] = None,
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    cache: bool = False,
+) -> "requests.Response":
+    """
+    Blocking GET through the shared client.
+
+    Args:
+        url (str): URL to fetch.
+        headers (dict, optional): Request headers.
+        timeout (tuple, optional): (connect, read) timeout in seconds.
+        cache (bool, optional): Send a conditional request and serve a 304 from
+            the on-disk HTTP cache. Ignored for authorized requests.
+
+    Returns:
+        requests.Response: The response, or a `CachedResponse` if the cached copy
+        is still valid.
+
+    Raises:
+        requests.exceptions.RequestException: On connection errors, timeouts or
+        HTTP error responses.
+    """
+    with span("fetch", host=urlsplit(url).netloc):
+        return _fetch(url, headers, timeout, cache)
+
+
+def _fetch(url, headers, timeout, cache) -> "requests.Response":
+    http_cache = None
+    if cache and not (headers and "Authorization" in headers):
+        http_cache = get_http_cache()
+
+    request_headers = dict(headers or {})
+    if http_cache is not None:
+        request_headers.update(http_cache.conditional_headers(url))
+
+    response = http_client.get(url, headers=request_headers, timeout=timeout)
+    response.raise_for_status()
+
+    if http_cache is not None:
+        if response.status_code == 304:
+            cached = http_cache.load(url)
+            if cached is not None:
+                return cached
+            # the stored body is gone, fetch it again unconditionally
+            response = http_client.get(url, headers=headers, timeout=timeout)
+            response.raise_for_status()
+        http_cache.store(url, response)
+
+    inc("bytes_downloaded", len(response.content), host=urlsplit(url).netloc)
+    return response
+
+
+def fetch_stream(
+    url: str,
+    headers: Dict[str, str] = None,
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+    cache: bool = False,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """
+    Streaming GET through the shared client, yielding the body in chunks.
+
+    The request is sent when iteration starts. With `cache=True` the request is
+    conditional; a 304 streams the stored body, and a fresh body is stored while
+    it is streamed.
+
+    Args:
+        url (str): URL to fetch.
+        headers (dict, optional): Request headers.
+        timeout (tuple, optional): (connect, read) timeout in seconds.
+        cache (bool, optional): Use the on-disk HTTP cache. Ignored for
+            authorized requests.
+        chunk_size (int, optional): Size of the yielded chunks.
+
+    Yields:
+        bytes: Body chunks.
+
+    Raises:
+        requests.exceptions.RequestException: On connection errors, timeouts or
+        HTTP error responses.
+    """
+    # the span also covers the time the consumer spends between chunks
+    with span("fetch", host=urlsplit(url).netloc):
+        yield from _fetch_stream(url, headers, timeout, cache, chunk_size)
+
+
+def _fetch_stream(url, headers, timeout, cache, chunk_size) -> Iterator[bytes]:
+    http_cache = None
+    if cache and not (headers and "Authorization" in headers):
+        http_cache = get_http_cache()
+
+    request_headers = dict(headers or {})
+    if http_cache is not None:
+        request_headers.update(http_cache.conditional_headers(url))
+
+    response = http_client.get(
+        url, headers=request_headers, timeout=timeout, stream=True
+    )
+    try:
+        response.raise_for_status()
+        if http_cache is not None and response.status_code == 304:
+            body = http_cache.iter_body(url, chunk_size)
+            if body is not None:
+                yield from body
+                return
+            # the stored body is gone, fetch it again unconditionally
+            response.close()
+            response = http_client.get(
+                url, headers=headers, timeout=timeout, stream=True
+            )
+            response.raise_for_status()
+
+        chunks = _count_downloaded(response.iter_content(chunk_size), url)
+        if http_cache is not None:
+            chunks = http_cache.store_stream(url, response, chunks)
+        yield from chunks
+    finally:
+        response.close()
+
+
+def _count_downloaded(chunks: Iterator[bytes], url: str) -> Iterator[bytes]:
+    downloaded = 0
+    try:
+        for chunk in chunks:
+            downloaded += len(chunk)
+            yield chunk
+    finally:
+        inc("bytes_downloaded", downloaded, host=urlsplit(url).netloc)
+
+
+async def _fetch_limited(
+    request: FetchRequest, semaphores: Dict[str, "asyncio.Semaphore"]
+) -> "requests.Response":
+    loop = asyncio.get_running_loop()
+    async with semaphores[request.host]:
+        return await loop.run_in_executor(
+            None, fetch, request.url, request.headers, request.timeout, request.cache
+        )
+
+
+async def fetch_all_async(
+    jobs: Dict[str, FetchRequest], host_limit: int = DEFAULT_HOST_LIMIT
+) -> Dict[str, Union["requests.Response", Exception]]:
+    """
+    Fetch all requests concurrently, at most `host_limit` at a time per host.
+
+    Args:
+        jobs (Dict[str, FetchRequest]): Requests keyed by an arbitrary name.
+        host_limit (int, optional): Maximum number of concurrent requests per host.
+
+    Returns:
+        Dict[str, Union["requests.Response", Exception]]: The response for every
+        name, or the exception raised while fetching it.
+    """
+    semaphores = {
+        host: asyncio.Semaphore(host_limit)
+        for host in {request.host for request in jobs.values()}
+    }
+    results = await asyncio.gather(
+        *(_fetch_limited(request, semaphores) for request in jobs.values()),
+        return_exceptions=True,
+    )
+    return dict(zip(jobs.keys(), results))
+
+
+def fetch_all(
+    jobs: Dict[str, FetchRequest], host_limit: int = DEFAULT_HOST_LIMIT
+) -> Dict[str, Union["requests.Response", Exception]]:
+    """Blocking wrapper around `fetch_all_async`."""
+    if not jobs:
+        return {}
+    return asyncio.run(fetch_all_async(jobs, host_limit))
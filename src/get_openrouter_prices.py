@@ -1,21 +1,44 @@
-import json
+import os
 
+from artifacts import PriceArtifact, write_price_artifacts
+from metrics import logger, set_gauge, span
+from price_entry import PriceEntry
 from utils import (
     SCALE_FACTOR_USD,
     fetch_and_sort_models,
-    integrate_prices,
+    merge_price_sources,
+    np,
     round_to_five,
+    round_to_five_array,
+    stream_models,
     yaml_to_json,
 )
 
-if __name__ == "__main__":
-    url = "https://openrouter.ai"
-    endpoint = "/api/v1/models"
-    headers = {"Content-Type": "application/json"}
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai")
+OPENROUTER_ENDPOINT = "/api/v1/models"
+OPENROUTER_CHANNEL_TYPE = 20  # Matches OpenRouter in ownedby.json
+
+
+def convert_openrouter_models(models: list, batched: bool = None) -> list:
+    """
+    Converts the raw OpenRouter model list into price entries.
+
+    Models without pricing information or with negative (variable) prices are skipped.
 
-    openrouter_channel_type = 20  # Matches OpenRouter in ownedby.json
+    Args:
+        models (list): Models as returned by the OpenRouter models API.
+        batched (bool, optional): Convert all prices at once with numpy instead of
+            model by model. Defaults to whether numpy is installed.
 
-    models = fetch_and_sort_models(url, endpoint, headers, mode="openrouter")
+    Returns:
+        list: Price entries for the openrouter channel.
+    """
+    if batched is None:
+        batched = np is not None
+    if batched:
+        return convert_openrouter_models_batched(models)
+
+    openrouter_channel_type = OPENROUTER_CHANNEL_TYPE
 
     openrouter_price_json = []
     for model in models:
@@ -30,27 +53,114 @@ if __name__ == "__main__":
             output_price = round_to_five(output_price)
 
             if input_price >= 0 and output_price >= 0:
-                price_data = {
-                    "model": model_name,
-                    "type": "tokens",
-                    "channel_type": openrouter_channel_type,
-                    "input": input_price,
-                    "output": output_price,
-                }
+                price_data = PriceEntry(
+                    model_name,
+                    "tokens",
+                    openrouter_channel_type,
+                    input_price,
+                    output_price,
+                )
                 openrouter_price_json.append(price_data)
-                print(
+                logger.debug(
                     f"Model: {model_name}, Input: {input_price}, Output: {output_price}"
                 )
-                print("-" * 40)
+                logger.debug("-" * 40)
+        except KeyError:
+            continue
+
+    return openrouter_price_json
+
+
+def convert_openrouter_models_batched(models: list) -> list:
+    """
+    Vectorized convert_openrouter_models, with bit-identical prices.
+
+    Args:
+        models (list): Models as returned by the OpenRouter models API.
+
+    Returns:
+        list: Price entries for the openrouter channel.
+    """
+    names, prompts, completions = [], [], []
+    for model in models:
+        try:
+            model_name = model["id"]
+            prompt = model["pricing"]["prompt"]
+            completion = model["pricing"]["completion"]
         except KeyError:
             continue
+        names.append(model_name)
+        prompts.append(float(prompt))
+        completions.append(float(completion))
+
+    input_prices = np.array(prompts, dtype=np.float64) * 1000 / SCALE_FACTOR_USD
+    output_prices = np.array(completions, dtype=np.float64) * 1000 / SCALE_FACTOR_USD
+    input_prices = round_to_five_array(input_prices)
+    output_prices = round_to_five_array(output_prices)
+
+    openrouter_price_json = [
+        PriceEntry(
+            model_name, "tokens", OPENROUTER_CHANNEL_TYPE, input_price, output_price
+        )
+        for model_name, input_price, output_price in zip(
+            names, input_prices, output_prices
+        )
+        if input_price >= 0 and output_price >= 0
+    ]
+    logger.info(
+        "Converted %d of %d priced OpenRouter models",
+        len(openrouter_price_json),
+        len(names),
+    )
+    return openrouter_price_json
+
+
+def get_openrouter_prices(
+    output_file: str = "openrouter_prices.json",
+    models: list = None,
+    stream: bool = False,
+) -> dict:
+    """
+    Fetches OpenRouter prices, integrates manual_prices/OpenRouter.yaml on top
+    and optionally saves the result.
+
+    Args:
+        output_file (str, optional): Where to save the integrated prices; skipped if empty.
+        models (list, optional): Already fetched models; fetched here if not given.
+        stream (bool, optional): Convert models while they are streamed from the
+            response instead of loading the whole payload first.
+
+    Returns:
+        dict: Integrated openrouter price data.
+    """
+    if models is None:
+        headers = {"Content-Type": "application/json"}
+        fetch_models = stream_models if stream else fetch_and_sort_models
+        models = fetch_models(
+            OPENROUTER_URL, OPENROUTER_ENDPOINT, headers, mode="openrouter"
+        )
+    with span("convert", source="openrouter"):
+        openrouter_price_json = convert_openrouter_models(models)
+    set_gauge("rows", len(openrouter_price_json), source="openrouter")
 
     # Load and convert manual_prices/OpenRouter.yaml
     manual_prices = yaml_to_json("manual_prices", "OpenRouter.yaml")
 
     # Integrate manual prices and openrouter_prices
-    integrated_prices = integrate_prices(manual_prices, {"data": openrouter_price_json})
+    integrated_prices = merge_price_sources(
+        manual_prices, {"data": openrouter_price_json}, label="openrouter"
+    )
 
     # Save integrated price data
-    with open("openrouter_prices.json", "w", encoding="utf-8") as f:
-        json.dump(integrated_prices, f, ensure_ascii=False, indent=2)
+    if output_file:
+        write_price_artifacts(integrated_prices, [PriceArtifact(output_file)])
+
+    return integrated_prices
+
+
+def main() -> None:
+    get_openrouter_prices()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
-import json
 import os
 
-import dotenv
-
+from artifacts import PriceArtifact, write_price_artifacts
+from metrics import logger, set_gauge, span
+from price_entry import PriceEntry
 from utils import (
     SCALE_FACTOR_CNY,
     fetch_and_sort_models,
-    integrate_prices,
+    merge_price_sources,
+    np,
     round_to_five,
+    round_to_five_array,
+    stream_models,
     yaml_to_json,
 )
 
@@ -35,19 +38,32 @@ def extract_specific_price(model_pricing, specification):
     )
 
 
-if __name__ == "__main__":
-    dotenv.load_dotenv()  # Load environment variables from .env file
+SILICONFLOW_URL = os.getenv("SILICONFLOW_URL", "https://busy-bear.siliconflow.cn")
+SILICONFLOW_ENDPOINT = "/api/v1/playground/comprehensive/all"
+SILICONFLOW_CHANNEL_TYPE = 45  # reference https://your-oneapi-url/api/ownedby
 
-    api_key: str = os.getenv("SILICONFLOW_API_KEY")
-    assert api_key is not None, "SILICONFLOW_API_KEY is not set"
 
-    url = "https://busy-bear.siliconflow.cn"  # Note: Removed 'https://' as http.client needs the host part
-    endpoint = "/api/v1/playground/comprehensive/all"
-    headers = {"Authorization": f"Bearer {api_key}"}
+def convert_siliconflow_models(model_json: list, batched: bool = None) -> list:
+    """
+    Converts the raw SiliconFlow model list into price entries.
+
+    Args:
+        model_json (list): Models as returned by the SiliconFlow playground API.
+        batched (bool, optional): Convert all prices at once with numpy instead of
+            model by model. Defaults to whether numpy is installed.
 
-    siliconflow_channel_type: int = 45  # reference https://your-oneapi-url/api/ownedby
+    Returns:
+        list: Price entries for the siliconflow channel.
 
-    model_json = fetch_and_sort_models(url, endpoint, headers, mode="siliconflow")
+    Raises:
+        ValueError: If a model uses an unknown price unit.
+    """
+    if batched is None:
+        batched = np is not None
+    if batched:
+        return convert_siliconflow_models_batched(model_json)
+
+    siliconflow_channel_type: int = SILICONFLOW_CHANNEL_TYPE
 
     processed_prices = []
     for model in model_json:
@@ -58,55 +74,165 @@ if __name__ == "__main__":
         if model_price_unit == "/ M Tokens" and len(model_pricing) == 2:
             completion_price = extract_specific_price(model_pricing, "completion")
             prompt_price = extract_specific_price(model_pricing, "prompt")
-            print(
-                f"Model Name: {model_name}, Completion Price: {completion_price} {model_price_unit}, Prompt Price: {prompt_price} {model_price_unit}",
-                flush=True,
+            logger.debug(
+                f"Model Name: {model_name}, Completion Price: {completion_price} {model_price_unit}, Prompt Price: {prompt_price} {model_price_unit}"
+            )
+            price_data = PriceEntry(
+                model_name,
+                "tokens",
+                siliconflow_channel_type,
+                round_to_five(prompt_price / 1000 / SCALE_FACTOR_CNY),
+                round_to_five(completion_price / 1000 / SCALE_FACTOR_CNY),
             )
-            price_data = {
-                "model": model_name,
-                "type": "tokens",
-                "channel_type": siliconflow_channel_type,
-                "input": round_to_five(prompt_price / 1000 / SCALE_FACTOR_CNY),
-                "output": round_to_five(completion_price / 1000 / SCALE_FACTOR_CNY),
-            }
 
         else:
             model_price = float(model["price"])
 
             if model_price_unit in ["/ M Tokens", "/ M UTF-8 bytes", "/ M px / Steps"]:
-                price_data = {
-                    "model": model_name,
-                    "type": "tokens",
-                    "channel_type": siliconflow_channel_type,
-                    "input": round_to_five(model_price / 1000 / SCALE_FACTOR_CNY),
-                    "output": round_to_five(model_price / 1000 / SCALE_FACTOR_CNY),
-                }
-                print(
+                price_data = PriceEntry(
+                    model_name,
+                    "tokens",
+                    siliconflow_channel_type,
+                    round_to_five(model_price / 1000 / SCALE_FACTOR_CNY),
+                    round_to_five(model_price / 1000 / SCALE_FACTOR_CNY),
+                )
+                logger.debug(
                     f"Model Name: {model_name}, Completion Price: {model_price} {model_price_unit}, Prompt Price: {model_price} {model_price_unit}"
                 )
             elif model_price_unit in ["/ Video", "/ Image", ""]:
-                price_data = {
-                    "model": model_name,
-                    "type": "times",
-                    "channel_type": siliconflow_channel_type,
-                    "input": round_to_five(model_price),
-                    "output": round_to_five(model_price),
-                }
-                print(
+                price_data = PriceEntry(
+                    model_name,
+                    "times",
+                    siliconflow_channel_type,
+                    round_to_five(model_price),
+                    round_to_five(model_price),
+                )
+                logger.debug(
                     f"Model Name: {model_name}, Pricing: {model_price} {model_price_unit}"
                 )
             else:
                 raise ValueError(f"Unknown price unit: {model_price_unit}")
 
         processed_prices.append(price_data)
-        print("-" * 40)
+        logger.debug("-" * 40)
+
+    return processed_prices
+
+
+def convert_siliconflow_models_batched(model_json: list) -> list:
+    """
+    Vectorized convert_siliconflow_models, with bit-identical prices.
+
+    Args:
+        model_json (list): Models as returned by the SiliconFlow playground API.
+
+    Returns:
+        list: Price entries for the siliconflow channel.
+
+    Raises:
+        ValueError: If a model uses an unknown price unit.
+    """
+    names, types, prompts, completions = [], [], [], []
+    for model in model_json:
+        model_pricing = model["pricing"]
+        model_price_unit = model["priceUnit"]
+
+        if model_price_unit == "/ M Tokens" and len(model_pricing) == 2:
+            prompt_price = extract_specific_price(model_pricing, "prompt")
+            completion_price = extract_specific_price(model_pricing, "completion")
+            model_type = "tokens"
+        else:
+            prompt_price = completion_price = float(model["price"])
+            if model_price_unit in ["/ M Tokens", "/ M UTF-8 bytes", "/ M px / Steps"]:
+                model_type = "tokens"
+            elif model_price_unit in ["/ Video", "/ Image", ""]:
+                model_type = "times"
+            else:
+                raise ValueError(f"Unknown price unit: {model_price_unit}")
+
+        names.append(model["modelName"])
+        types.append(model_type)
+        prompts.append(prompt_price)
+        completions.append(completion_price)
+
+    # token prices are per M tokens in CNY, per-call prices are used as they are
+    is_tokens = np.array([model_type == "tokens" for model_type in types], dtype=bool)
+    prompts = np.array(prompts, dtype=np.float64)
+    completions = np.array(completions, dtype=np.float64)
+    input_prices = round_to_five_array(
+        np.where(is_tokens, prompts / 1000 / SCALE_FACTOR_CNY, prompts)
+    )
+    output_prices = round_to_five_array(
+        np.where(is_tokens, completions / 1000 / SCALE_FACTOR_CNY, completions)
+    )
+
+    processed_prices = [
+        PriceEntry(
+            model_name, model_type, SILICONFLOW_CHANNEL_TYPE, input_price, output_price
+        )
+        for model_name, model_type, input_price, output_price in zip(
+            names, types, input_prices, output_prices
+        )
+    ]
+    logger.info("Converted %d SiliconFlow models", len(processed_prices))
+    return processed_prices
+
+
+def get_siliconflow_prices(
+    api_key: str,
+    output_file: str = "siliconflow_prices.json",
+    model_json: list = None,
+    stream: bool = False,
+) -> dict:
+    """
+    Fetches SiliconFlow prices, integrates manual_prices/Siliconflow.yaml on top
+    and optionally saves the result.
+
+    Args:
+        api_key (str): SiliconFlow API key.
+        output_file (str, optional): Where to save the integrated prices; skipped if empty.
+        model_json (list, optional): Already fetched and sorted models; fetched here if not given.
+        stream (bool, optional): Convert models while they are streamed from the
+            response instead of loading the whole payload first.
+
+    Returns:
+        dict: Integrated siliconflow price data.
+    """
+    if model_json is None:
+        headers = {"Authorization": f"Bearer {api_key}"}
+        fetch_models = stream_models if stream else fetch_and_sort_models
+        model_json = fetch_models(
+            SILICONFLOW_URL, SILICONFLOW_ENDPOINT, headers, mode="siliconflow"
+        )
+    with span("convert", source="siliconflow"):
+        processed_prices = convert_siliconflow_models(model_json)
+    set_gauge("rows", len(processed_prices), source="siliconflow")
 
     # Load and convert manual_prices/Siliconflow.yaml
     manual_prices = yaml_to_json("manual_prices", "Siliconflow.yaml")
 
     # Integrate manual prices and siliconflow_prices
-    integrated_prices = integrate_prices(manual_prices, {"data": processed_prices})
+    integrated_prices = merge_price_sources(
+        manual_prices, {"data": processed_prices}, label="siliconflow"
+    )
 
     # 保存集成后的价格数据
-    with open("siliconflow_prices.json", "w", encoding="utf-8") as f:
-        json.dump(integrated_prices, f, ensure_ascii=False, indent=2)
+    if output_file:
+        write_price_artifacts(integrated_prices, [PriceArtifact(output_file)])
+
+    return integrated_prices
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()  # Load environment variables from .env file
+
+    api_key: str = os.getenv("SILICONFLOW_API_KEY")
+    assert api_key is not None, "SILICONFLOW_API_KEY is not set"
+
+    get_siliconflow_prices(api_key)
+
+
+if __name__ == "__main__":
+    main()
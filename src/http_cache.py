@@ -0,0 +1,307 @@
+"""
+On-disk cache for conditional GET requests.
+
+Responses that carry an ETag or Last-Modified validator are stored under the
+cache directory. The next request for the same URL sends If-None-Match /
+If-Modified-Since, and a 304 answer is served from the stored body. The decoded
+JSON payload of a cached body is pickled next to it, so unchanged sources are
+neither downloaded nor parsed again. Bodies can also be stored and served as
+chunk streams (see `store_stream` and `iter_body`).
+
+Entries older than the TTL are dropped and the least recently used entries are
+evicted once the cache grows beyond its size limit.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional
+
+from lazy_import import lazy_import
+
+requests = lazy_import("requests")
+
+DEFAULT_CACHE_DIR = os.path.join(".cache", "http")
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class CachedResponse:
+    """A stored response body, exposing the parts of `requests.Response` we use."""
+
+    status_code = 200
+    from_cache = True
+
+    def __init__(self, cache: "HTTPCache", url: str, content: bytes, headers: Dict):
+        self._cache = cache
+        self.url = url
+        self.content = content
+        self.headers = headers
+        self.encoding = headers.get("encoding") or "utf-8"
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        payload = self._cache.load_payload(self.url)
+        if payload is None:
+            payload = json.loads(self.text)
+            self._cache.store_payload(self.url, payload)
+        return payload
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class HTTPCache:
+    """
+    Persistent validator-based HTTP cache.
+
+    Args:
+        directory (str): Where bodies and the index are stored.
+        ttl (float): Seconds after which an entry is dropped.
+        max_bytes (int): Upper bound for the total size of stored bodies.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index_path = os.path.join(directory, "index.json")
+        self._index = self._read_index()
+
+    def _read_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_index(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self._index_path)
+
+    def _path(self, url: str, suffix: str) -> str:
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.{suffix}")
+
+    def _remove(self, url: str) -> None:
+        self._index.pop(url, None)
+        for suffix in ("body", "pickle"):
+            try:
+                os.remove(self._path(url, suffix))
+            except FileNotFoundError:
+                pass
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """
+        Validator headers for a request to `url`.
+
+        Returns:
+            Dict[str, str]: If-None-Match / If-Modified-Since headers, or an empty
+            dict if nothing usable is cached.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return {}
+            if time.time() - entry["stored_at"] > self.ttl:
+                self._remove(url)
+                self._write_index()
+                return {}
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            return headers
+
+    def load(self, url: str) -> Optional[CachedResponse]:
+        """
+        Load the stored response for `url`, typically after a 304.
+
+        Returns:
+            Optional[CachedResponse]: The stored response, or None if it is missing.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return None
+            try:
+                with open(self._path(url, "body"), "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                self._remove(url)
+                self._write_index()
+                return None
+            entry["used_at"] = time.time()
+            self._write_index()
+        return CachedResponse(self, url, content, {"encoding": entry.get("encoding")})
+
+    def store(self, url: str, response: "requests.Response") -> bool:
+        """
+        Store a 200 response that carries a validator.
+
+        Returns:
+            bool: Whether the response was stored.
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return False
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._remove(url)
+            body_path = self._path(url, "body")
+            with open(f"{body_path}.tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{body_path}.tmp", body_path)
+
+            now = time.time()
+            self._index[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "encoding": response.encoding,
+                "size": len(response.content),
+                "stored_at": now,
+                "used_at": now,
+            }
+            self._evict()
+            self._write_index()
+        return True
+
+    def iter_body(self, url: str, chunk_size: int = 65536) -> Optional[Iterator[bytes]]:
+        """
+        Stream the stored body for `url` in chunks, typically after a 304.
+
+        Returns:
+            Optional[Iterator[bytes]]: The body chunks, or None if nothing is stored.
+        """
+        with self._lock:
+            entry = self._index.get(url)
+            if entry is None:
+                return None
+            try:
+                body = open(self._path(url, "body"), "rb")
+            except FileNotFoundError:
+                self._remove(url)
+                self._write_index()
+                return None
+            entry["used_at"] = time.time()
+            self._write_index()
+
+        def chunks():
+            with body:
+                while True:
+                    chunk = body.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        return chunks()
+
+    def store_stream(
+        self, url: str, response: "requests.Response", chunks: Iterable[bytes]
+    ) -> Iterator[bytes]:
+        """
+        Pass the body chunks of `response` through, storing them as they go.
+
+        The body is only committed to the cache once the stream was read to the
+        end; responses without a validator are passed through untouched.
+        """
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            yield from chunks
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        body_path = self._path(url, "body")
+        tmp_path = f"{body_path}.{threading.get_ident()}.tmp"
+        size = 0
+        completed = False
+        try:
+            with open(tmp_path, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if not completed:
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._remove(url)
+            os.replace(tmp_path, body_path)
+            now = time.time()
+            self._index[url] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "encoding": response.encoding,
+                "size": size,
+                "stored_at": now,
+                "used_at": now,
+            }
+            self._evict()
+            self._write_index()
+
+    def load_payload(self, url: str):
+        """Return the pickled JSON payload of the stored body, or None."""
+        try:
+            with open(self._path(url, "pickle"), "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def store_payload(self, url: str, payload) -> None:
+        """Pickle the decoded JSON payload of the stored body."""
+        with self._lock:
+            if url not in self._index:
+                return
+            path = self._path(url, "pickle")
+            with open(f"{path}.tmp", "wb") as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(f"{path}.tmp", path)
+
+    def _evict(self) -> None:
+        now = time.time()
+        for url, entry in list(self._index.items()):
+            if now - entry["stored_at"] > self.ttl:
+                self._remove(url)
+
+        total = sum(entry["size"] for entry in self._index.values())
+        for url, entry in sorted(self._index.items(), key=lambda e: e[1]["used_at"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            self._remove(url)
+
+
+_default_cache: Optional[HTTPCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> HTTPCache:
+    """
+    Return the process-wide cache, stored in $HTTP_CACHE_DIR (default .cache/http).
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HTTPCache(os.getenv("HTTP_CACHE_DIR", DEFAULT_CACHE_DIR))
+    return _default_cache
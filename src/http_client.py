@@ -0,0 +1,213 @@
+"""
+Shared HTTP client: pooled session, per-host rate limit and request retries.
+
+Every request of the scripts goes through `request`. An idempotent request
+(GET, or one the caller marks as such) that fails with a connection error, a
+timeout or a transient status (429, 5xx) is retried by itself with exponential
+backoff and jitter, waiting at least as long as the server asks for in
+Retry-After. Other requests are only retried if they were rejected before the
+server processed them. Before each attempt a token is taken from the bucket of
+the target host, which caps the request rate per host.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from lazy_import import lazy_import
+from metrics import inc
+
+requests = lazy_import("requests")
+
+POOL_SIZE = 16
+# attempts per request, including the first one
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "4"))
+# requests per second and burst size allowed per host
+HTTP_RATE_LIMIT = float(os.getenv("HTTP_RATE_LIMIT", "10"))
+HTTP_RATE_BURST = int(os.getenv("HTTP_RATE_BURST", "10"))
+
+RETRY_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+# retried on any failure; other methods only opt in per call, since a timeout
+# or 5xx can come after the server already applied the request
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# statuses meaning the request was not processed, safe to retry for any method
+REJECTED_STATUSES = frozenset({429})
+BACKOFF_BASE = 0.5  # seconds
+BACKOFF_MAX = 30  # seconds
+RETRY_AFTER_MAX = 120  # seconds, longer waits are not worth it
+
+_session: Optional["requests.Session"] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> "requests.Session":
+    """
+    Return the process-wide session, creating it on first use.
+
+    Returns:
+        requests.Session: Session with a connection pool sized for concurrent requests.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` requests per second with bursts of `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take a token, sleeping until one is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(url: str) -> TokenBucket:
+    host = urlsplit(url).netloc
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = _buckets[host] = TokenBucket(HTTP_RATE_LIMIT, HTTP_RATE_BURST)
+    return bucket
+
+
+def retry_after(response: "requests.Response") -> Optional[float]:
+    """
+    Seconds to wait according to the Retry-After header of `response`.
+
+    Returns:
+        Optional[float]: The delay, or None if the header is missing or invalid.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    import email.utils
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+def backoff(attempt: int) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (from 1)."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+def request(
+    method: str,
+    url: str,
+    retries: int = None,
+    idempotent: bool = None,
+    **kwargs,
+) -> "requests.Response":
+    """
+    Send a request through the shared session, retrying transient failures.
+
+    Requests that are not idempotent are only retried when they cannot have
+    reached the server: on a connect timeout or a 429 answer.
+
+    Args:
+        method (str): HTTP method.
+        url (str): URL to request.
+        retries (int, optional): Attempts including the first one
+            (default: $HTTP_RETRIES; 0 or 1 disables retries).
+        idempotent (bool, optional): Whether repeating the request is harmless
+            (default: True for GET, HEAD and OPTIONS).
+        **kwargs: Passed on to `requests.Session.request`.
+
+    Returns:
+        requests.Response: The last response; statuses are not raised, a
+        transient status is returned once the attempts are used up.
+
+    Raises:
+        requests.exceptions.RequestException: If the last attempt failed with a
+        connection error or timeout.
+    """
+    attempts = max(1, HTTP_RETRIES if retries is None else retries)
+    if idempotent is None:
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+    retry_errors = (
+        (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+        if idempotent
+        else (requests.exceptions.ConnectTimeout,)
+    )
+    retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+    session = get_session()
+    bucket = _bucket(url)
+    for attempt in range(1, attempts + 1):
+        bucket.acquire()
+        try:
+            response = session.request(method, url, **kwargs)
+        except retry_errors as e:
+            if attempt == attempts:
+                raise
+            delay = backoff(attempt)
+            print(f"{method} {url} failed ({e}), retrying in {delay:.1f}s")
+            inc("http_retries", host=urlsplit(url).netloc)
+        else:
+            if response.status_code not in retry_statuses or attempt == attempts:
+                return response
+            delay = backoff(attempt)
+            requested = retry_after(response)
+            if requested is not None:
+                delay = max(delay, min(requested, RETRY_AFTER_MAX))
+            print(
+                f"{method} {url} returned {response.status_code}, "
+                f"retrying in {delay:.1f}s"
+            )
+            inc("http_retries", host=urlsplit(url).netloc)
+            response.close()
+        time.sleep(delay)
+
+
+def get(url: str, **kwargs) -> "requests.Response":
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> "requests.Response":
+    return request("POST", url, **kwargs)
+
+
+def delete(url: str, **kwargs) -> "requests.Response":
+    return request("DELETE", url, **kwargs)
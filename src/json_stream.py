@@ -0,0 +1,200 @@
+"""
+Incremental extraction of the items of a JSON array from a chunked stream.
+
+`iter_json_array` walks the document down a path of object keys (e.g.
+("data", "models")) without materializing anything it passes, then decodes the
+array's items one at a time. Only the item being decoded is held in memory, not
+the whole body or the whole parsed tree.
+"""
+
+import codecs
+import json
+import re
+from typing import Iterable, Iterator, Sequence, Union
+
+_WHITESPACE = " \t\n\r"
+# characters that may follow a complete value
+_VALUE_END = _WHITESPACE + ",]}:"
+# next character that matters while skipping a container / a string
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+# end of a number, true, false or null
+_SCALAR_END = re.compile(r"[\s,\]}]")
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Text buffer over a chunk iterator, dropping what has been consumed."""
+
+    def __init__(self, chunks: Iterable[Union[bytes, str]]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def more(self) -> bool:
+        """Append the next chunk to the buffer. Returns False at the end of the stream."""
+        if self.eof:
+            return False
+        if 65536 < self.pos <= len(self.buf):
+            self.buf = self.buf[self.pos :]
+            self.pos = 0
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._utf8.decode(chunk)
+            if chunk:
+                self.buf += chunk
+                return True
+        self.buf += self._utf8.decode(b"", final=True)
+        self.eof = True
+        return False
+
+    def drain(self) -> None:
+        """Read the rest of the stream without decoding it."""
+        for _ in self._chunks:
+            pass
+        self.eof = True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it, '' at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(
+                f"Expected one of {chars!r} in JSON stream, found {char or 'end of data'!r}"
+            )
+        self.pos += 1
+        return char
+
+    def decode_value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # a number cut off at the end of the buffer ("0" of "0.5", "1" of
+            # "1e3") may continue in the next chunk
+            incomplete = end == len(self.buf) or self.buf[end] not in _VALUE_END
+            if incomplete and self.more():
+                continue
+            self.pos = end
+            return value
+
+    def _search(self, pattern: re.Pattern) -> re.Match:
+        while True:
+            match = pattern.search(self.buf, self.pos)
+            if match:
+                return match
+            self.pos = len(self.buf)
+            if not self.more():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _skip_string(self) -> None:
+        # self.pos is just past the opening quote
+        while True:
+            match = self._search(_STRING_SPECIAL)
+            if match.group() == '"':
+                self.pos = match.end()
+                return
+            # skip the escaped character, which may be in the next chunk
+            self.pos = match.end() + 1
+            while self.pos > len(self.buf):
+                if not self.more():
+                    raise ValueError("Unexpected end of JSON stream")
+
+    def skip_value(self) -> None:
+        """Consume the next JSON value without decoding it."""
+        char = self.peek()
+        if char == '"':
+            self.pos += 1
+            self._skip_string()
+        elif char in ("{", "["):
+            self.pos += 1
+            depth = 1
+            while depth:
+                match = self._search(_STRUCTURAL)
+                self.pos = match.end()
+                token = match.group()
+                if token == '"':
+                    self._skip_string()
+                elif token in "[{":
+                    depth += 1
+                else:
+                    depth -= 1
+        elif char:
+            while True:
+                match = _SCALAR_END.search(self.buf, self.pos)
+                if match:
+                    self.pos = match.start()
+                    return
+                if not self.more():
+                    self.pos = len(self.buf)
+                    return
+        else:
+            raise ValueError("Unexpected end of JSON stream")
+
+
+def _seek(reader: _Reader, path: Sequence[str]) -> None:
+    """Consume the stream up to and including the '[' of the array at `path`."""
+    for depth, key in enumerate(path):
+        reader.expect("{")
+        while True:
+            if reader.peek() == "}":
+                raise KeyError(
+                    f"Key {'.'.join(path[: depth + 1])} not found in JSON stream"
+                )
+            name = reader.decode_value()
+            reader.expect(":")
+            if name == key:
+                break
+            reader.skip_value()
+            if reader.expect(",}") == "}":
+                raise KeyError(
+                    f"Key {'.'.join(path[: depth + 1])} not found in JSON stream"
+                )
+    reader.expect("[")
+
+
+def iter_json_array(
+    chunks: Iterable[Union[bytes, str]], path: Sequence[str] = ()
+) -> Iterator[object]:
+    """
+    Yield the items of the JSON array found at `path` in a chunked JSON document.
+
+    Args:
+        chunks (Iterable[Union[bytes, str]]): The document, in chunks of UTF-8
+            bytes or text, e.g. `response.iter_content(65536)`.
+        path (Sequence[str], optional): Object keys leading to the array; empty
+            if the document itself is the array.
+
+    Yields:
+        object: The decoded array items, in order.
+
+    Raises:
+        KeyError: If `path` does not exist in the document.
+        ValueError: If the document is not valid JSON or the value at `path` is
+            not an array.
+    """
+    reader = _Reader(chunks)
+    _seek(reader, path)
+    if reader.peek() != "]":
+        while True:
+            yield reader.decode_value()
+            if reader.expect(",]") == "]":
+                break
+    # read the stream to its end so that e.g. a caching layer sees all of it
+    reader.drain()
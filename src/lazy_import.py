@@ -0,0 +1,60 @@
+"""
+Deferred imports of heavy modules.
+
+    requests = lazy_import("requests")
+    np = lazy_import("numpy", optional=True)
+
+binds a stand-in that imports the real module on its first attribute access, so
+a script only pays for requests, yaml, numpy or asyncio when it actually uses
+them. Names that are looked up at import time (base classes, decorators,
+annotations) would load the module right away; quote such annotations, e.g.
+`-> "requests.Response"`.
+
+Unlike `importlib.util.LazyLoader`, the real module is imported normally with
+`importlib.import_module`, which is safe when several threads touch the
+stand-in at once.
+"""
+
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in for a module, importing it on first attribute access."""
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        # later lookups find the attributes directly and skip __getattr__
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self.__name__!r}>"
+
+
+def lazy_import(name: str, optional: bool = False):
+    """
+    Return module `name`, importing it only when one of its attributes is used.
+
+    Args:
+        name (str): Absolute module name.
+        optional (bool, optional): Return None instead of raising if the module
+            is not installed.
+
+    Returns:
+        The module if it is already imported, otherwise a stand-in for it, or
+        None for a missing optional module.
+
+    Raises:
+        ModuleNotFoundError: If a required module is not installed.
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    if importlib.util.find_spec(name) is None:
+        if optional:
+            return None
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    return _LazyModule(name)
@@ -1,8 +1,22 @@
 import json
+import os
 
-import requests
+from artifacts import PriceArtifact, write_price_artifacts, write_price_shards
+from fetch import fetch, fetch_stream
+from json_stream import iter_json_array
+from lazy_import import lazy_import
+from metrics import set_gauge, span
+from price_db import write_price_db
+from price_delta import load_price_snapshot, write_price_delta
+from price_entry import PriceEntry, as_price_entries
+from utils import merge_price_sources, yaml_to_json
 
-from utils import integrate_prices, yaml_to_json
+requests = lazy_import("requests")
+
+
+def is_onehub_only_price(item) -> bool:
+    """Whether a price row belongs to a supplier with id <= 1000."""
+    return isinstance(item["channel_type"], int) and item["channel_type"] <= 1000
 
 
 def filter_onehub_only_prices(prices: dict) -> dict:
@@ -15,63 +29,158 @@ def filter_onehub_only_prices(prices: dict) -> dict:
     Returns:
         dict: Filtered price data.
     """
-    return {
-        "data": [
-            item
-            for item in prices["data"]
-            if isinstance(item["channel_type"], int) and item["channel_type"] <= 1000
-        ]
-    }
+    return {"data": [item for item in prices["data"] if is_onehub_only_price(item)]}
 
 
-if __name__ == "__main__":
-    # 加载所有手工定价表格
-    yaml_dir_path = "manual_prices"
-    integrated_manual_prices = yaml_to_json(yaml_dir_path)
+MARTIALBE_PRICES_URL = os.getenv(
+    "MARTIALBE_PRICES_URL",
+    "https://raw.githubusercontent.com/MartialBE/one-api/prices/prices.json",
+)
 
-    # 加载所有自动定价表格
-    # 读取 siliconflow_prices.json 和 openrouter_prices.json 文件
+
+def load_price_file(json_file_path: str) -> dict:
+    """
+    Load a previously generated price file, falling back to empty data.
+
+    Args:
+        json_file_path (str): Path to the JSON price file.
+
+    Returns:
+        dict: Price data, or {"data": []} if the file does not exist.
+    """
     try:
-        with open("siliconflow_prices.json", "r", encoding="utf-8") as file:
-            siliconflow_prices = json.load(file)
+        with open(json_file_path, "r", encoding="utf-8") as file:
+            prices = json.load(file)
+        return {"data": [PriceEntry.from_dict(row) for row in prices["data"]]}
     except FileNotFoundError:
-        print("未找到 siliconflow_prices.json 文件，将跳过 siliconflow 价格。")
-        siliconflow_prices = {"data": []}
+        print(f"未找到 {json_file_path} 文件，将跳过该来源的价格。")
+        return {"data": []}
+
 
+def _stream_martialbe_prices():
     try:
-        with open("openrouter_prices.json", "r", encoding="utf-8") as file:
-            openrouter_prices = json.load(file)
-    except FileNotFoundError:
-        print("未找到 openrouter_prices.json 文件，将跳过 openrouter 价格。")
-        openrouter_prices = {"data": []}
+        yield from iter_json_array(fetch_stream(MARTIALBE_PRICES_URL, cache=True))
+    except (requests.RequestException, ValueError) as e:
+        print(f"获取 provider 价格出错: {e}")
 
-    # 集成手动价格、siliconflow_prices 和 openrouter_prices
-    integrated_prices = integrate_prices(integrated_manual_prices, siliconflow_prices)
-    integrated_prices = integrate_prices(integrated_prices, openrouter_prices)
 
-    # 获取 provider 的价格
+def fetch_martialbe_prices(stream: bool = False) -> dict:
+    """
+    Fetch the upstream MartialBE one-api price list.
+
+    Args:
+        stream (bool, optional): Return the prices as an iterator that decodes
+            them one at a time while they are downloaded. A failed download
+            then ends the iterator early instead of yielding nothing.
+
+    Returns:
+        dict: Upstream price data, or {"data": []} if the request fails.
+    """
+    if stream:
+        return {"data": _stream_martialbe_prices()}
+
     try:
-        response = requests.get(
-            "https://raw.githubusercontent.com/MartialBE/one-api/prices/prices.json"
-        )
-        response.raise_for_status()
-        upstream_martialbe_onehub_prices = {"data": response.json()}
+        response = fetch(MARTIALBE_PRICES_URL, cache=True)
+        with span("parse", source="martialbe"):
+            return {"data": response.json()}
     except requests.RequestException as e:
         print(f"获取 provider 价格出错: {e}")
-        upstream_martialbe_onehub_prices = {"data": []}
+        return {"data": []}
 
-    # 集成 provider 的价格，确保手动价格优先
-    final_prices = integrate_prices(integrated_prices, upstream_martialbe_onehub_prices)
 
-    # 将集成后的价格数据保存到 oneapi_prices.json 文件
-    with open("oneapi_prices.json", "w", encoding="utf-8") as file:
-        json.dump(final_prices, file, indent=2, ensure_ascii=False)
+def _count_rows(rows, source: str):
+    """Yield `rows`, recording how many there were as the rows gauge of `source`."""
+    count = 0
+    for count, row in enumerate(rows, 1):
+        yield row
+    set_gauge("rows", count, source=source)
 
-    # 生成 onehub_only_prices.json 文件
-    onehub_only_prices = filter_onehub_only_prices(final_prices)
-    with open("onehub_only_prices.json", "w", encoding="utf-8") as file:
-        json.dump(onehub_only_prices, file, indent=2, ensure_ascii=False)
 
-    print(
-        "已将集成后的价格数据保存到 oneapi_prices.json 和 onehub_only_prices.json 文件。"
+def merge_prices(
+    siliconflow_prices: dict,
+    openrouter_prices: dict,
+    yaml_dir_path: str = "manual_prices",
+    save_to_file: bool = True,
+    upstream_prices: dict = None,
+    stream: bool = False,
+) -> dict:
+    """
+    Merge manual, siliconflow, openrouter and upstream MartialBE prices, in that
+    order of precedence, and optionally save oneapi_prices.json and
+    onehub_only_prices.json.
+
+    Args:
+        siliconflow_prices (dict): Integrated siliconflow price data.
+        openrouter_prices (dict): Integrated openrouter price data.
+        yaml_dir_path (str, optional): Directory holding the manual price YAML files.
+        save_to_file (bool, optional): Whether to write the output JSON files.
+        upstream_prices (dict, optional): Already fetched MartialBE price data;
+            fetched here if not given.
+        stream (bool, optional): Stream the MartialBE prices if they are fetched here.
+
+    Returns:
+        dict: The final merged price data.
+    """
+    # 加载所有手工定价表格
+    integrated_manual_prices = yaml_to_json(yaml_dir_path)
+    set_gauge("rows", len(integrated_manual_prices["data"]), source="manual")
+
+    # 获取 provider 的价格
+    if upstream_prices is None:
+        upstream_prices = fetch_martialbe_prices(stream=stream)
+    upstream_martialbe_onehub_prices = {
+        "data": _count_rows(as_price_entries(upstream_prices["data"]), "martialbe")
+    }
+
+    # 按优先级一次性合并：手动价格 > siliconflow > openrouter > provider
+    final_prices = merge_price_sources(
+        integrated_manual_prices,
+        siliconflow_prices,
+        openrouter_prices,
+        upstream_martialbe_onehub_prices,
+        label="merged",
     )
+    set_gauge("rows", len(final_prices["data"]), source="merged")
+
+    if save_to_file:
+        # 覆盖前读取上次发布的价格表，用于生成增量；master 不跟踪输出文件，
+        # 工作流会先从 prices 分支取回 oneapi_prices.json 和 deltas/
+        previous_snapshot = load_price_snapshot("oneapi_prices.json")
+
+        # 一次遍历同时生成 oneapi_prices.json 和 onehub_only_prices.json 文件
+        write_price_artifacts(
+            final_prices,
+            [
+                PriceArtifact("oneapi_prices.json"),
+                PriceArtifact("onehub_only_prices.json", is_onehub_only_price),
+            ],
+        )
+
+        print(
+            "已将集成后的价格数据保存到 oneapi_prices.json 和 onehub_only_prices.json 文件。"
+        )
+
+        # 按 channel_type 分片，并生成 manifest
+        manifest = write_price_shards(final_prices)
+        print(f"已生成 {len(manifest['shards'])} 个渠道分片。")
+
+        # 生成相对上次发布版本的增量
+        write_price_delta(previous_snapshot, final_prices)
+
+        # 导出带索引的 SQLite 数据库
+        write_price_db(final_prices)
+
+    return final_prices
+
+
+def main() -> None:
+    # 加载所有自动定价表格
+    # 读取 siliconflow_prices.json 和 openrouter_prices.json 文件
+    siliconflow_prices = load_price_file("siliconflow_prices.json")
+    openrouter_prices = load_price_file("openrouter_prices.json")
+
+    merge_prices(siliconflow_prices, openrouter_prices)
+
+
+if __name__ == "__main__":
+    main()
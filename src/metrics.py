@@ -0,0 +1,294 @@
+"""
+Run metrics: timed spans and counters, exported at the end of a run.
+
+Code paths record what they do through the process-wide registry:
+
+    with span("convert", source="siliconflow"):
+        ...
+
+    @timed("write", artifact="sqlite")
+    def write_price_db(...):
+        ...
+
+    inc("bytes_downloaded", len(body), host=host)
+    set_gauge("rows", len(prices), source="manual")
+
+Spans are summed per name and labels (count, total and longest duration), so
+concurrent fetches add up to more than the wall time of the fetch stage.
+Counters add up, gauges keep the last value.
+
+When a run ends the registry is written as a Prometheus textfile
+($METRICS_TEXTFILE, for node_exporter's textfile collector) and/or as a JSON
+run report ($METRICS_REPORT); see `configure_outputs`.
+
+Per-model output goes to the `onehub_prices` logger at DEBUG level and is off
+by default; set $LOG_LEVEL=DEBUG (or pass --verbose to the pipeline) to see it.
+"""
+
+import atexit
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+METRICS_PREFIX = "onehub_prices"
+
+# help text of the Prometheus metrics, by metric name without the prefix
+METRIC_HELP = {
+    "span_seconds": "Time spent in spans of work, summed over calls.",
+    "span_calls": "Number of calls of spans of work.",
+    "span_max_seconds": "Longest single call of spans of work.",
+    "stage_seconds": "Duration of the last attempt of each pipeline stage.",
+    "stage_failures": "Failed attempts of each pipeline stage.",
+    "rows": "Price rows per source.",
+    "rows_overridden": "Rows dropped per merge because a higher-precedence "
+    "source (manual prices first) has the same model and channel.",
+    "rows_skipped": "Upstream rows skipped because a price field is missing.",
+    "aliases_expanded": "Alias rows expanded from manual prices.",
+    "bytes_downloaded": "Response bytes downloaded per host (304s count as 0).",
+    "bytes_written": "Bytes written to output files.",
+    "http_retries": "Requests retried per host.",
+    "run_seconds": "Duration of the run.",
+    "run_success": "1 if the run succeeded, 0 if it failed.",
+    "last_run_timestamp_seconds": "Unix time the run finished.",
+}
+
+logger = logging.getLogger("onehub_prices")
+
+
+def configure_logging(level: str = None) -> None:
+    """
+    Send the `onehub_prices` logger to stdout at `level` (default: $LOG_LEVEL).
+
+    Without a level the logger keeps its defaults, which hide the DEBUG
+    per-model output.
+    """
+    level = level or os.getenv("LOG_LEVEL")
+    if not level:
+        return
+    logger.setLevel(level.upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: dict) -> Labels:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Metrics:
+    """Thread-safe registry of spans, counters and gauges."""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        # (name, labels) -> [calls, total seconds, longest call]
+        self._spans: Dict[Tuple[str, Labels], list] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Time the enclosed block as a call of span `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            key = (name, _labels(labels))
+            with self._lock:
+                stats = self._spans.setdefault(key, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def report(self) -> dict:
+        """The registry as a JSON-serializable run report."""
+        now = time.time()
+        with self._lock:
+            spans = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "calls": calls,
+                    "seconds": round(total, 6),
+                    "max_seconds": round(longest, 6),
+                }
+                for (name, labels), (calls, total, longest) in sorted(
+                    self._spans.items()
+                )
+            ]
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            gauges = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._gauges.items())
+            ]
+        return {
+            "started_at": _isoformat(self.started_at),
+            "finished_at": _isoformat(now),
+            "duration_seconds": round(now - self.started_at, 6),
+            "spans": spans,
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+    def prometheus(self) -> str:
+        """The registry in the Prometheus text exposition format."""
+        samples: Dict[str, list] = {}
+        types: Dict[str, str] = {}
+
+        def add(name, metric_type, labels, value):
+            types.setdefault(name, metric_type)
+            samples.setdefault(name, []).append((labels, value))
+
+        with self._lock:
+            for (name, labels), (calls, total, longest) in self._spans.items():
+                labels = (("span", name),) + labels
+                add("span_seconds", "counter", labels, total)
+                add("span_calls", "counter", labels, calls)
+                add("span_max_seconds", "gauge", labels, longest)
+            for (name, labels), value in self._counters.items():
+                add(name, "counter", labels, value)
+            for (name, labels), value in self._gauges.items():
+                add(name, "gauge", labels, value)
+
+        lines = []
+        for name in sorted(samples):
+            full_name = f"{METRICS_PREFIX}_{name}"
+            if name in METRIC_HELP:
+                lines.append(f"# HELP {full_name} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {full_name} {types[name]}")
+            for labels, value in sorted(samples[name]):
+                lines.append(
+                    f"{full_name}{_format_labels(labels)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _format_value(value: float) -> str:
+    # full precision: %g would round byte counts and timestamps
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+_metrics = Metrics()
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide registry."""
+    return _metrics
+
+
+def span(name: str, **labels):
+    return _metrics.span(name, **labels)
+
+
+def timed(name: str, **labels):
+    """Decorator timing every call of the function as span `name`."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _metrics.span(name, **labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    _metrics.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    _metrics.set_gauge(name, value, **labels)
+
+
+def _write_atomic(file_path: str, text: str) -> None:
+    # the textfile collector may read at any time, so never expose a partial file
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, file_path)
+
+
+def write_outputs(textfile: str = None, report: str = None) -> None:
+    """
+    Write the registry as a Prometheus textfile and/or a JSON run report.
+
+    Args:
+        textfile (str, optional): Path of the .prom file.
+        report (str, optional): Path of the JSON report.
+    """
+    metrics = get_metrics()
+    finished_at = time.time()
+    set_gauge("run_seconds", finished_at - metrics.started_at)
+    set_gauge("last_run_timestamp_seconds", finished_at)
+    if textfile:
+        _write_atomic(textfile, metrics.prometheus())
+    if report:
+        _write_atomic(
+            report, json.dumps(metrics.report(), indent=2, ensure_ascii=False) + "\n"
+        )
+
+
+_outputs = {"textfile": None, "report": None}
+_outputs_registered = False
+
+
+def configure_outputs(textfile: Optional[str], report: Optional[str]) -> None:
+    """
+    Write the metrics to `textfile` and/or `report` when the process exits.
+
+    Called on import with $METRICS_TEXTFILE and $METRICS_REPORT; entry points
+    may call it again to override them.
+    """
+    global _outputs_registered
+    _outputs.update(textfile=textfile, report=report)
+    if (textfile or report) and not _outputs_registered:
+        atexit.register(lambda: write_outputs(**_outputs))
+        _outputs_registered = True
+
+
+configure_logging()
+configure_outputs(os.getenv("METRICS_TEXTFILE"), os.getenv("METRICS_REPORT"))
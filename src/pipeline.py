@@ -0,0 +1,438 @@
+"""
+Run the whole price update pipeline in a single process.
+
+The stages that used to be separate script invocations (get_ownedby,
+sync_ownedby, get_siliconflow_prices, get_openrouter_prices, merge_prices and
+sync_pricing) are run as a DAG of functions. Results are handed from stage to
+stage in memory and stages whose dependencies are satisfied run concurrently.
+All upstream sources are downloaded at once by the `fetch` stage; a stage whose
+source failed to download fetches it again by itself when it is retried.
+
+Usage:
+    python src/pipeline.py [--no-sync] [--stream] [--force] [--only STAGE ...]
+                           [--profile STAGE ...]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from artifacts import get_digest_store
+from fetch import FetchRequest, fetch_all
+from get_openrouter_prices import (
+    OPENROUTER_ENDPOINT,
+    OPENROUTER_URL,
+    get_openrouter_prices,
+)
+from get_siliconflow_prices import (
+    SILICONFLOW_ENDPOINT,
+    SILICONFLOW_URL,
+    get_siliconflow_prices,
+)
+from merge_prices import MARTIALBE_PRICES_URL, merge_prices
+from metrics import configure_logging, configure_outputs, inc, set_gauge, span
+from profiling import configure_profiling, parse_stages, profile
+from sync_ownedby import index_ownedby, load_ownedby, update_ownedby
+from sync_targets import (
+    load_onehub_targets,
+    sync_ownedby_targets,
+    sync_pricing_targets,
+)
+from utils import (
+    OWNEDBY_URL,
+    get_channel_id_mapping,
+    remember_channel_id_mapping,
+    save_ownedby,
+    sort_models,
+)
+
+
+class Stage:
+    """A named pipeline step and the names of the stages whose results it consumes."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Dict[str, object]], object],
+        deps: Iterable[str] = (),
+    ):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+    def __repr__(self) -> str:
+        return f"Stage({self.name!r}, deps={self.deps!r})"
+
+
+def _run_stage(
+    stage: Stage, inputs: Dict[str, object], retries: int, retry_delay: float
+) -> object:
+    """Run a single stage, retrying it up to `retries` times on failure."""
+    for attempt in range(1, retries + 1):
+        start = time.perf_counter()
+        try:
+            with profile(stage.name):
+                result = stage.func(inputs)
+        except Exception as e:
+            print(f"[pipeline] {stage.name} failed (attempt {attempt}/{retries}): {e}")
+            inc("stage_failures", stage=stage.name)
+            if attempt == retries:
+                raise
+            time.sleep(retry_delay)
+        else:
+            elapsed = time.perf_counter() - start
+            print(f"[pipeline] {stage.name} finished in {elapsed:.2f}s")
+            set_gauge("stage_seconds", elapsed, stage=stage.name)
+            return result
+
+
+def run_stages(
+    stages: List[Stage],
+    max_workers: int = None,
+    retries: int = 1,
+    retry_delay: float = 5,
+) -> Tuple[Dict[str, object], Dict[str, Exception]]:
+    """
+    Run stages as a DAG, starting every stage as soon as its dependencies are done.
+
+    Args:
+        stages (List[Stage]): The stages to run.
+        max_workers (int, optional): Maximum number of stages running at once.
+        retries (int, optional): Attempts per stage before it is considered failed.
+        retry_delay (float, optional): Seconds to wait between attempts.
+
+    Returns:
+        Tuple[Dict[str, object], Dict[str, Exception]]: Results of the stages that
+        succeeded, and errors of the stages that failed or were skipped because a
+        dependency failed.
+
+    Raises:
+        ValueError: If a stage depends on an unknown stage or the graph has a cycle.
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = set(stage.deps) - names
+        if unknown:
+            raise ValueError(f"Stage {stage.name} depends on unknown stages: {unknown}")
+
+    results: Dict[str, object] = {}
+    failed: Dict[str, Exception] = {}
+    pending = {stage.name: stage for stage in stages}
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(stages) or 1) as executor:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(dep in failed for dep in stage.deps):
+                    del pending[name]
+                    failed[name] = RuntimeError("skipped, dependency failed")
+                    print(f"[pipeline] {name} skipped because a dependency failed")
+                elif all(dep in results for dep in stage.deps):
+                    del pending[name]
+                    inputs = {dep: results[dep] for dep in stage.deps}
+                    future = executor.submit(
+                        _run_stage, stage, inputs, retries, retry_delay
+                    )
+                    running[future] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(
+                        f"Dependency cycle between stages: {sorted(pending)}"
+                    )
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    failed[name] = e
+
+    return results, failed
+
+
+def fetch_sources(
+    siliconflow_api_key: str = None, stream: bool = False
+) -> Dict[str, object]:
+    """
+    Download all upstream sources concurrently and decode their JSON payloads.
+
+    Args:
+        siliconflow_api_key (str, optional): SiliconFlow API key; the SiliconFlow
+            source is skipped without it.
+        stream (bool, optional): Only fetch ownedby; the price catalogs are then
+            streamed by the stages converting them.
+
+    Returns:
+        Dict[str, object]: The decoded payload of every source, or the exception
+        raised while fetching or decoding it.
+    """
+    jobs = {"ownedby": FetchRequest(OWNEDBY_URL)}
+    if not stream:
+        jobs["openrouter"] = FetchRequest(
+            f"{OPENROUTER_URL}{OPENROUTER_ENDPOINT}",
+            headers={"Content-Type": "application/json"},
+            cache=True,
+        )
+        jobs["martialbe"] = FetchRequest(MARTIALBE_PRICES_URL, cache=True)
+    if siliconflow_api_key and not stream:
+        jobs["siliconflow"] = FetchRequest(
+            f"{SILICONFLOW_URL}{SILICONFLOW_ENDPOINT}",
+            headers={"Authorization": f"Bearer {siliconflow_api_key}"},
+        )
+
+    payloads = {}
+    for name, response in fetch_all(jobs).items():
+        if isinstance(response, Exception):
+            print(f"[pipeline] failed to fetch {name}: {response}")
+            payloads[name] = response
+            continue
+        try:
+            with span("parse", source=name):
+                payloads[name] = response.json()
+        except ValueError as e:
+            print(f"[pipeline] failed to decode {name}: {e}")
+            payloads[name] = e
+
+    # seed the channel id mapping so manual price conversion needs no request
+    if not isinstance(payloads["ownedby"], Exception):
+        remember_channel_id_mapping(payloads["ownedby"])
+    return payloads
+
+
+def _prefetched(inputs: Dict[str, object], name: str):
+    """Return the payload prefetched for `name`, or None if it is not available."""
+    payload = inputs["fetch"].get(name)
+    if payload is None or isinstance(payload, Exception):
+        return None
+    return payload
+
+
+def build_stages(
+    sync: bool = True, stream: bool = False, force: bool = False
+) -> List[Stage]:
+    """
+    Build the default price pipeline.
+
+    Args:
+        sync (bool, optional): Whether to include the OneHub sync stages.
+        stream (bool, optional): Stream the price catalogs into the conversion
+            stages instead of downloading them up front, keeping memory use
+            bounded by one model record.
+        force (bool, optional): Sync prices even to instances that already
+            received the same prices.
+
+    Returns:
+        List[Stage]: The pipeline stages.
+    """
+
+    def ownedby(r):
+        payload = _prefetched(r, "ownedby")
+        if payload is None:
+            return get_channel_id_mapping(save_to_file=True)
+        return save_ownedby(payload)
+
+    def siliconflow(r):
+        api_key = os.getenv("SILICONFLOW_API_KEY")
+        assert api_key is not None, "SILICONFLOW_API_KEY is not set"
+        payload = _prefetched(r, "siliconflow")
+        model_json = sort_models(payload, "siliconflow") if payload else None
+        return get_siliconflow_prices(api_key, model_json=model_json, stream=stream)
+
+    def openrouter(r):
+        payload = _prefetched(r, "openrouter")
+        models = sort_models(payload, "openrouter") if payload else None
+        return get_openrouter_prices(models=models, stream=stream)
+
+    def merge(r):
+        payload = _prefetched(r, "martialbe")
+        upstream_prices = {"data": payload} if payload is not None else None
+        return merge_prices(
+            r["siliconflow"],
+            r["openrouter"],
+            upstream_prices=upstream_prices,
+            stream=stream,
+        )
+
+    def fetch(_):
+        return fetch_sources(os.getenv("SILICONFLOW_API_KEY"), stream=stream)
+
+    stages = [
+        Stage("fetch", fetch),
+        Stage("ownedby", ownedby, deps=("fetch",)),
+        Stage("siliconflow", siliconflow, deps=("fetch",)),
+        Stage("openrouter", openrouter, deps=("fetch",)),
+        Stage("merge", merge, deps=("fetch", "siliconflow", "openrouter")),
+    ]
+    if not sync:
+        return stages
+
+    # instances already synced, so a retry of a stage skips them
+    ownedby_synced: Dict[str, object] = {}
+    prices_synced: Dict[str, object] = {}
+
+    def push_ownedby(r):
+        targets = [
+            target
+            for target in load_onehub_targets()
+            if target.name not in ownedby_synced
+        ]
+        # the diff against the upstream ownedby is the same for every instance
+        ownedby_updates = update_ownedby(
+            index_ownedby(r["ownedby"]["data"]),
+            load_ownedby(json_file_path="ownedby_manual.json"),
+        )
+        print(
+            f"ownedby: {len(ownedby_updates['to_delete'])} to delete, "
+            f"{len(ownedby_updates['to_add'])} to add"
+        )
+        results, failed = sync_ownedby_targets(targets, ownedby_updates)
+        ownedby_synced.update(results)
+        if failed:
+            raise RuntimeError(f"ownedby sync failed for {', '.join(sorted(failed))}")
+        return dict(ownedby_synced)
+
+    def push_prices(r):
+        targets = [
+            target
+            for target in load_onehub_targets()
+            if target.name not in prices_synced
+        ]
+        results, failed = sync_pricing_targets(
+            targets,
+            r["merge"]["data"],
+            os.getenv("SYNC_PRICE_UPDATE_MODE", "delta"),
+            os.getenv("SYNC_PRICE_DELTA_SOURCE", "server"),
+            force=force,
+        )
+        prices_synced.update(results)
+        if failed:
+            raise RuntimeError(f"price sync failed for {', '.join(sorted(failed))}")
+        # download the latest ownedby.json to local for git purpose
+        return get_channel_id_mapping(save_to_file=True)
+
+    stages.append(Stage("sync_ownedby", push_ownedby, deps=("ownedby",)))
+    stages.append(Stage("sync_pricing", push_prices, deps=("merge", "sync_ownedby")))
+    return stages
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()  # Load environment variables from .env file
+
+    parser = argparse.ArgumentParser(description="Run the price pipeline.")
+    parser.add_argument(
+        "--no-sync",
+        action="store_true",
+        help="Only fetch and merge prices, do not push anything to OneHub.",
+    )
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        metavar="STAGE",
+        help="Run only the given stages (and the stages they depend on).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the price catalogs model by model instead of loading them whole.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=1,
+        help="Attempts per stage before giving up (default: 1). Failed requests "
+        "are already retried by the HTTP client, see $HTTP_RETRIES.",
+    )
+    parser.add_argument(
+        "--retry-delay",
+        type=float,
+        default=5,
+        help="Seconds to wait between attempts (default: 5).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Sync prices even if they are unchanged since the last successful sync.",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Print every converted model (same as LOG_LEVEL=DEBUG).",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        default=os.getenv("METRICS_TEXTFILE"),
+        metavar="PATH",
+        help="Write the run metrics as a Prometheus textfile (default: $METRICS_TEXTFILE).",
+    )
+    parser.add_argument(
+        "--metrics-report",
+        default=os.getenv("METRICS_REPORT"),
+        metavar="PATH",
+        help="Write the run metrics as a JSON report (default: $METRICS_REPORT).",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="+",
+        default=parse_stages(os.getenv("PROFILE")),
+        metavar="STAGE",
+        help='Profile the given stages ("all" for every stage) with cProfile and '
+        "tracemalloc, see profiling.py (default: $PROFILE).",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default=None,
+        metavar="DIR",
+        help="Where the profiling reports are written (default: $PROFILE_DIR, profiles).",
+    )
+    args = parser.parse_args()
+    if args.verbose:
+        configure_logging("DEBUG")
+    configure_outputs(args.metrics_textfile, args.metrics_report)
+
+    stages = build_stages(sync=not args.no_sync, stream=args.stream, force=args.force)
+    if args.only:
+        by_name = {stage.name: stage for stage in stages}
+        unknown = set(args.only) - set(by_name)
+        if unknown:
+            parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+        wanted = set()
+        todo = list(args.only)
+        while todo:
+            name = todo.pop()
+            if name not in wanted:
+                wanted.add(name)
+                todo.extend(by_name[name].deps)
+        stages = [stage for stage in stages if stage.name in wanted]
+    unknown = set(args.profile) - {stage.name for stage in stages} - {"all"}
+    if unknown:
+        parser.error(f"unknown stages to profile: {', '.join(sorted(unknown))}")
+    configure_profiling(args.profile, args.profile_dir)
+
+    start = time.perf_counter()
+    _, failed = run_stages(stages, retries=args.retries, retry_delay=args.retry_delay)
+    print(f"[pipeline] done in {time.perf_counter() - start:.2f}s")
+
+    set_gauge("run_success", 0 if failed else 1)
+    changed = sorted(get_digest_store().changed)
+    print(f"[pipeline] changed artifacts: {', '.join(changed) or 'none'}")
+    # let the workflow skip committing and publishing when nothing changed
+    if os.getenv("GITHUB_OUTPUT"):
+        with open(os.environ["GITHUB_OUTPUT"], "a", encoding="utf-8") as f:
+            f.write(f"changed={'true' if changed else 'false'}\n")
+
+    if failed:
+        for name, error in failed.items():
+            print(f"[pipeline] {name}: {error}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+SQLite export of the merged prices, with a small query API.
+
+The database has two tables:
+
+- prices: one row per price (model, type, channel_type, input, output), with
+  a unique index on (model, channel_type) and indexes on channel_type and type.
+- extra_ratios: the extra_ratios of each price, one row per ratio, keyed by
+  (price_id, position) so the original key order is kept.
+
+Use `PriceDB` to look prices up without loading the whole catalog:
+
+    with PriceDB("oneapi_prices.sqlite") as db:
+        db.get("gpt-4o", 1)
+        db.by_channel(45)
+
+or from the command line: `python src/price_db.py gpt-4o --channel 1`.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+from typing import List, Optional
+
+from artifacts import DigestStore, file_digest, get_digest_store, json_digest
+from metrics import inc, timed
+from price_entry import PRICE_FIELDS, PriceEntry, to_json
+
+PRICE_DB_FILE = os.getenv("PRICE_DB_FILE", "oneapi_prices.sqlite")
+# bumped when the schema changes, so an old database is rebuilt
+PRICE_DB_VERSION = 1
+
+# input/output/ratio have no declared type, so SQLite keeps ints and floats
+# apart and the rows read back serialize exactly as they were written
+SCHEMA = """
+CREATE TABLE prices (
+    id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    type TEXT NOT NULL,
+    channel_type,
+    input,
+    output,
+    has_extra_ratios INTEGER NOT NULL,
+    extra TEXT
+);
+CREATE TABLE extra_ratios (
+    price_id INTEGER NOT NULL REFERENCES prices (id),
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    ratio,
+    PRIMARY KEY (price_id, position)
+) WITHOUT ROWID;
+"""
+
+INDEXES = """
+CREATE UNIQUE INDEX prices_model ON prices (model, channel_type);
+CREATE INDEX prices_channel_type ON prices (channel_type);
+CREATE INDEX prices_type ON prices (type);
+"""
+
+
+def _price_rows(rows):
+    for price_id, row in enumerate(rows, 1):
+        entry = PriceEntry.from_dict(row)
+        extra = dict(entry.extra or {})
+        ratios = entry.get("extra_ratios")
+        if "extra_ratios" in entry and not isinstance(ratios, dict):
+            extra["extra_ratios"] = ratios  # e.g. null, kept as it is
+            ratios = None
+        yield (
+            price_id,
+            entry.model,
+            entry.type,
+            entry.channel_type,
+            entry.input,
+            entry.output,
+            int(ratios is not None),
+            json.dumps(extra, ensure_ascii=False) if extra else None,
+        ), ratios
+
+
+@timed("write", artifact="sqlite")
+def write_price_db(
+    prices: dict, db_path: str = None, store: DigestStore = None
+) -> bool:
+    """
+    Export price data to an SQLite database.
+
+    The database is built in a temporary file and moved into place, so readers
+    never see a half-written one. Like the JSON artifacts, it is not rebuilt if
+    the data and the file are the same as after the last export.
+
+    Args:
+        prices (dict): Price data with the rows in "data".
+        db_path (str, optional): The database file (default: $PRICE_DB_FILE,
+            "oneapi_prices.sqlite").
+        store (DigestStore, optional): Where the digests are kept (default: the
+            process-wide store).
+
+    Returns:
+        bool: Whether the database content changed.
+    """
+    db_path = db_path or PRICE_DB_FILE
+    store = store or get_digest_store()
+    data_digest = f"{json_digest(prices)}:v{PRICE_DB_VERSION}"
+    current_digest = file_digest(db_path)
+    if (
+        current_digest is not None
+        and store.get(f"data:{db_path}") == data_digest
+        and store.get(f"file:{db_path}") == current_digest
+    ):
+        print(f"{db_path} 未变化，跳过写入。")
+        return False
+
+    tmp_path = f"{db_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(f"PRAGMA user_version = {PRICE_DB_VERSION}")
+        conn.executescript(SCHEMA)
+        with conn:
+            ratio_rows = []
+            price_rows = []
+            for price_row, ratios in _price_rows(prices["data"]):
+                price_rows.append(price_row)
+                for position, (name, ratio) in enumerate((ratios or {}).items()):
+                    ratio_rows.append((price_row[0], position, name, ratio))
+            conn.executemany(
+                "INSERT INTO prices VALUES (?, ?, ?, ?, ?, ?, ?, ?)", price_rows
+            )
+            conn.executemany("INSERT INTO extra_ratios VALUES (?, ?, ?, ?)", ratio_rows)
+        conn.executescript(INDEXES)
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    inc("bytes_written", os.path.getsize(tmp_path))
+    os.replace(tmp_path, db_path)
+    # the database is not committed to master, so a missing file is rebuilt on
+    # every CI run; it only counts as changed if the data did
+    changed = store.get(f"data:{db_path}") != data_digest
+    if changed:
+        store.mark_changed(db_path)
+    store.put({f"data:{db_path}": data_digest, f"file:{db_path}": file_digest(db_path)})
+    print(f"已导出 {len(price_rows)} 条价格到 {db_path}。")
+    return changed
+
+
+class PriceDB:
+    """
+    Read-only queries on a database written by `write_price_db`.
+
+    Args:
+        db_path (str, optional): The database file (default: $PRICE_DB_FILE).
+
+    Raises:
+        FileNotFoundError: If the database does not exist.
+    """
+
+    _COLUMNS = "id, model, type, channel_type, input, output, has_extra_ratios, extra"
+
+    def __init__(self, db_path: str = None):
+        db_path = db_path or PRICE_DB_FILE
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(db_path)
+        self._conn = sqlite3.connect(
+            f"file:{db_path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __enter__(self) -> "PriceDB":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _entries(self, where: str, params: tuple) -> List[PriceEntry]:
+        rows = self._conn.execute(
+            f"SELECT {self._COLUMNS} FROM prices WHERE {where} ORDER BY id", params
+        ).fetchall()
+        ratios = {}
+        if any(row[6] for row in rows):
+            for price_id, name, ratio in self._conn.execute(
+                "SELECT price_id, name, ratio FROM extra_ratios WHERE price_id IN "
+                f"(SELECT id FROM prices WHERE {where}) ORDER BY price_id, position",
+                params,
+            ):
+                ratios.setdefault(price_id, {})[name] = ratio
+        entries = []
+        for price_id, *fields, has_ratios, extra in rows:
+            row = dict(zip(PRICE_FIELDS, fields))
+            extra = json.loads(extra) if extra else {}
+            if "extra_ratios" in extra:
+                row["extra_ratios"] = extra.pop("extra_ratios")
+            elif has_ratios:
+                row["extra_ratios"] = ratios.get(price_id, {})
+            row.update(extra)
+            entries.append(PriceEntry.from_dict(row))
+        return entries
+
+    def get(self, model: str, channel_type: int) -> Optional[PriceEntry]:
+        """The price of `model` on `channel_type`, or None."""
+        entries = self._entries("model = ? AND channel_type = ?", (model, channel_type))
+        return entries[0] if entries else None
+
+    def find(self, model: str) -> List[PriceEntry]:
+        """The prices of `model` on all channels."""
+        return self._entries("model = ?", (model,))
+
+    def by_channel(self, channel_type: int) -> List[PriceEntry]:
+        """All prices of `channel_type`, sorted by model."""
+        return self._entries("channel_type = ?", (channel_type,))
+
+    def by_type(self, type: str) -> List[PriceEntry]:
+        """All prices of a type ("tokens" or "times")."""
+        return self._entries("type = ?", (type,))
+
+    def channel_types(self) -> List[int]:
+        """The channel types with prices."""
+        return [
+            row[0]
+            for row in self._conn.execute(
+                "SELECT DISTINCT channel_type FROM prices ORDER BY channel_type"
+            )
+        ]
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM prices").fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the SQLite price export.")
+    parser.add_argument("model", nargs="?", help="Model to look up.")
+    parser.add_argument("--channel", type=int, help="Channel type to filter by.")
+    parser.add_argument("--type", help='Price type to filter by ("tokens"/"times").')
+    parser.add_argument(
+        "--db", default=PRICE_DB_FILE, help="Database file (default: %(default)s)."
+    )
+    args = parser.parse_args()
+
+    with PriceDB(args.db) as db:
+        if args.model and args.channel is not None:
+            entry = db.get(args.model, args.channel)
+            entries = [entry] if entry else []
+        elif args.model:
+            entries = db.find(args.model)
+        elif args.channel is not None:
+            entries = db.by_channel(args.channel)
+        elif args.type:
+            entries = db.by_type(args.type)
+        else:
+            parser.error("give a model, --channel or --type")
+        if args.type:
+            entries = [entry for entry in entries if entry.type == args.type]
+    print(json.dumps(entries, indent=2, ensure_ascii=False, default=to_json))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Deltas between consecutive published price snapshots.
+
+Every time oneapi_prices.json changes, a delta from the previous snapshot is
+written to deltas/<sequence>.json: the rows that were added or changed and the
+(model, channel_type) keys that were removed. deltas/index.json holds the
+sequence number and sha256 of the current snapshot and lists the kept deltas
+with the sha256 of the snapshot each one applies to. A client that is a few
+versions behind looks up the delta whose base_sha256 is the hash of its copy,
+applies it with `apply_price_delta`, and repeats until it reaches the current
+sha256, instead of downloading the full file.
+
+The previous snapshot and the index are read from the working directory. The
+outputs are not tracked on master, so the workflow restores oneapi_prices.json
+and deltas/ from the prices branch before the pipeline runs.
+"""
+
+import json
+import os
+from typing import Dict, List, NamedTuple, Optional
+
+from artifacts import DigestStore, file_digest, get_digest_store, write_json_artifact
+from metrics import inc, timed
+from price_entry import to_json
+
+PRICE_DELTA_DIR = os.getenv("PRICE_DELTA_DIR", "deltas")
+# number of deltas kept, older ones are deleted
+PRICE_DELTA_KEEP = int(os.getenv("PRICE_DELTA_KEEP", "100"))
+DELTA_INDEX = "index.json"
+DELTA_VERSION = 1
+
+
+class PriceSnapshot(NamedTuple):
+    """The rows of a published price file and the sha256 of its bytes."""
+
+    rows: list
+    sha256: str
+
+
+def load_price_snapshot(file_path: str) -> Optional[PriceSnapshot]:
+    """
+    Read a published price file.
+
+    Returns:
+        Optional[PriceSnapshot]: The snapshot, or None if the file is missing
+        or not valid JSON.
+    """
+    sha256 = file_digest(file_path)
+    if sha256 is None:
+        return None
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            return PriceSnapshot(json.load(f)["data"], sha256)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def row_key(row) -> tuple:
+    return (row["model"], row["channel_type"])
+
+
+def _encode_row(row) -> str:
+    return json.dumps(row, separators=(",", ":"), ensure_ascii=False, default=to_json)
+
+
+def diff_prices(old_rows, new_rows) -> dict:
+    """
+    Row-level difference between two price lists, keyed by (model, channel_type).
+
+    Args:
+        old_rows: Rows of the previous snapshot.
+        new_rows: Rows of the new snapshot.
+
+    Returns:
+        dict: "added" and "changed" rows of the new snapshot, in its order,
+        and the "removed" keys as [model, channel_type] pairs.
+    """
+    old = {row_key(row): _encode_row(row) for row in old_rows}
+    added, changed = [], []
+    for row in new_rows:
+        encoded = old.pop(row_key(row), None)
+        if encoded is None:
+            added.append(row)
+        elif encoded != _encode_row(row):
+            changed.append(row)
+    removed = [list(key) for key in old]
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def apply_price_delta(rows: List[dict], delta: dict) -> List[dict]:
+    """
+    Apply a delta to the rows of the snapshot it was made from.
+
+    Args:
+        rows (List[dict]): Rows of the base snapshot.
+        delta (dict): A delta as written by `write_price_delta`.
+
+    Returns:
+        List[dict]: Rows of the new snapshot, in the published order
+        (channel_type, then model).
+    """
+    by_key: Dict[tuple, dict] = {row_key(row): row for row in rows}
+    for model, channel_type in delta["removed"]:
+        by_key.pop((model, channel_type), None)
+    for row in delta["changed"] + delta["added"]:
+        by_key[row_key(row)] = row
+    return sorted(by_key.values(), key=lambda row: (row["channel_type"], row["model"]))
+
+
+def _load_index(index_path: str) -> dict:
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") == DELTA_VERSION:
+            return index
+    except (FileNotFoundError, ValueError):
+        pass
+    return {"version": DELTA_VERSION, "sequence": 0, "sha256": None, "deltas": []}
+
+
+@timed("write", artifact="delta")
+def write_price_delta(
+    previous: Optional[PriceSnapshot],
+    prices: dict,
+    file_path: str = "oneapi_prices.json",
+    directory: str = None,
+    keep: int = None,
+    store: DigestStore = None,
+) -> Optional[dict]:
+    """
+    Publish the delta from the previous snapshot of `file_path` to `prices`.
+
+    Call it after the new snapshot has been written. Nothing is written if the
+    file did not change; without a previous snapshot only the index is
+    started.
+
+    Args:
+        previous (Optional[PriceSnapshot]): The snapshot before this run, see
+            `load_price_snapshot`.
+        prices (dict): The new price data, as written to `file_path`.
+        file_path (str, optional): The published price file.
+        directory (str, optional): Where the deltas are written
+            (default: $PRICE_DELTA_DIR, "deltas").
+        keep (int, optional): Number of deltas to keep
+            (default: $PRICE_DELTA_KEEP).
+        store (DigestStore, optional): Where changed files are recorded
+            (default: the process-wide store).
+
+    Returns:
+        Optional[dict]: The delta written, or None.
+    """
+    directory = directory or PRICE_DELTA_DIR
+    keep = PRICE_DELTA_KEEP if keep is None else keep
+    store = store or get_digest_store()
+    index_path = os.path.join(directory, DELTA_INDEX)
+    index = _load_index(index_path)
+    sha256 = file_digest(file_path)
+    os.makedirs(directory, exist_ok=True)
+    if index["sha256"] == sha256 or (previous and previous.sha256 == sha256):
+        if index["sha256"] != sha256:
+            index["sha256"] = sha256
+            write_json_artifact(index_path, index, store=store)
+        return None
+
+    index["sequence"] += 1
+    index["sha256"] = sha256
+    delta = None
+    if previous is not None:
+        delta = {
+            "version": DELTA_VERSION,
+            "sequence": index["sequence"],
+            "base_sha256": previous.sha256,
+            "sha256": sha256,
+            **diff_prices(previous.rows, prices["data"]),
+        }
+        file_name = f"{index['sequence']}.json"
+        path = os.path.join(directory, file_name)
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            f.write(_encode_row(delta))
+        inc("bytes_written", os.path.getsize(f"{path}.tmp"))
+        os.replace(f"{path}.tmp", path)
+        store.mark_changed(path)
+        index["deltas"].append(
+            {
+                "sequence": delta["sequence"],
+                "file": file_name,
+                "base_sha256": delta["base_sha256"],
+                "sha256": sha256,
+                "added": len(delta["added"]),
+                "removed": len(delta["removed"]),
+                "changed": len(delta["changed"]),
+                "bytes": os.path.getsize(path),
+            }
+        )
+        print(
+            f"{file_path} 增量 #{delta['sequence']}: "
+            f"新增 {len(delta['added'])}，删除 {len(delta['removed'])}，"
+            f"修改 {len(delta['changed'])}"
+        )
+
+    # 只保留最近的增量
+    expired = index["deltas"][:-keep] if keep else index["deltas"]
+    index["deltas"] = index["deltas"][len(expired) :]
+    for entry in expired:
+        path = os.path.join(directory, entry["file"])
+        if os.path.exists(path):
+            os.remove(path)
+            store.mark_changed(path)
+    write_json_artifact(index_path, index, store=store)
+    return delta
@@ -0,0 +1,237 @@
+"""
+Compact representation of price rows.
+
+A `PriceEntry` stores the fields of one row in `__slots__` instead of a dict,
+with interned model and type strings. Equal extra_ratios are stored once as a
+shared, immutable `FrozenRatios`, so aliases and models with the same ratios do
+not carry copies of them. Entries are only turned into the JSON row shape
+(`to_dict`) when they are serialized; `json.dumps(data, default=to_json)`
+does that on the fly.
+
+For code written against plain dict rows, entries also support read-only item
+access (`entry["model"]`, `entry.get("extra_ratios")`, `"extra_ratios" in entry`).
+"""
+
+import sys
+from typing import Dict, Iterable, Iterator, Optional
+
+from metrics import inc, logger
+
+# the row fields, in the order they are serialized
+PRICE_FIELDS = ("model", "type", "channel_type", "input", "output")
+
+
+class FrozenRatios(dict):
+    """A read-only extra_ratios mapping, shared between entries."""
+
+    __slots__ = ()
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("extra_ratios are shared between entries and read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        # unpickled ratios are shared again
+        return freeze_ratios, (dict(self),)
+
+
+_shared_ratios: Dict[tuple, FrozenRatios] = {}
+
+
+def freeze_ratios(ratios: Optional[dict]):
+    """
+    Return the shared FrozenRatios equal to `ratios`.
+
+    Values other than dicts (e.g. None) are returned as they are.
+    """
+    if not isinstance(ratios, dict):
+        return ratios
+    if isinstance(ratios, FrozenRatios):
+        return ratios
+    try:
+        # 1, 1.0 and True are equal but serialize differently
+        key = tuple((name, type(value), value) for name, value in ratios.items())
+        return _shared_ratios.setdefault(key, FrozenRatios(ratios))
+    except TypeError:  # unhashable values
+        return FrozenRatios(ratios)
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+_MISSING = object()
+
+
+class PriceEntry:
+    """
+    One price row: model, type, channel_type, input and output price, and the
+    optional extra_ratios.
+
+    Args:
+        model (str): Model name.
+        type (str): "tokens" or "times".
+        channel_type (int): Channel id (may be None until it is resolved).
+        input (float): Input price.
+        output (float): Output price.
+        extra_ratios (dict, optional): Extra price ratios; left out of the row
+            if not given.
+        extra (dict, optional): Any further fields of rows read from upstream,
+            serialized after the known ones.
+    """
+
+    __slots__ = PRICE_FIELDS + ("extra_ratios", "extra")
+
+    def __init__(
+        self,
+        model,
+        type,
+        channel_type,
+        input,
+        output,
+        extra_ratios=_MISSING,
+        extra: Optional[dict] = None,
+    ):
+        self.model = _intern(model)
+        self.type = _intern(type)
+        self.channel_type = channel_type
+        self.input = input
+        self.output = output
+        self.extra_ratios = freeze_ratios(extra_ratios)
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, row: dict) -> "PriceEntry":
+        """
+        Build an entry from a JSON price row.
+
+        Raises:
+            ValueError: If the row lacks one of the PRICE_FIELDS.
+        """
+        if isinstance(row, PriceEntry):
+            return row
+        extra = {
+            key: value
+            for key, value in row.items()
+            if key not in PRICE_FIELDS and key != "extra_ratios"
+        }
+        try:
+            return cls(
+                row["model"],
+                row["type"],
+                row["channel_type"],
+                row["input"],
+                row["output"],
+                row.get("extra_ratios", _MISSING),
+                extra,
+            )
+        except KeyError as e:
+            raise ValueError(
+                f"price row of {row.get('model')!r} has no {e.args[0]!r}"
+            ) from None
+
+    def to_dict(self) -> dict:
+        """The JSON price row."""
+        row = {
+            "model": self.model,
+            "type": self.type,
+            "channel_type": self.channel_type,
+            "input": self.input,
+            "output": self.output,
+        }
+        if self.extra_ratios is not _MISSING:
+            row["extra_ratios"] = self.extra_ratios
+        if self.extra:
+            row.update(self.extra)
+        return row
+
+    def replace(self, **changes) -> "PriceEntry":
+        """Return a copy with the given fields changed."""
+        entry = object.__new__(PriceEntry)
+        for field in PriceEntry.__slots__:
+            setattr(entry, field, getattr(self, field))
+        for field, value in changes.items():
+            if field not in PRICE_FIELDS:
+                raise TypeError(f"Unknown price field: {field}")
+            setattr(entry, field, _intern(value))
+        return entry
+
+    # read-only dict interface
+    def __getitem__(self, key: str):
+        if key in PRICE_FIELDS:
+            return getattr(self, key)
+        if key == "extra_ratios" and self.extra_ratios is not _MISSING:
+            return self.extra_ratios
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, PriceEntry):
+            other = other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        has_ratios = self.extra_ratios is not _MISSING
+        ratios = self.extra_ratios if has_ratios else None
+        fields = tuple(getattr(self, field) for field in PRICE_FIELDS)
+        return fields + (has_ratios, ratios, self.extra)
+
+    def __setstate__(self, state):
+        *fields, has_ratios, ratios, extra = state
+        for field, value in zip(PRICE_FIELDS, fields):
+            setattr(self, field, _intern(value))
+        self.extra_ratios = ratios if has_ratios else _MISSING
+        self.extra = extra
+
+    def __repr__(self) -> str:
+        return f"PriceEntry({self.to_dict()!r})"
+
+
+def as_price_entries(rows: Iterable) -> Iterator[PriceEntry]:
+    """
+    Convert JSON price rows to entries lazily; entries are passed through.
+
+    Rows lacking one of the PRICE_FIELDS, e.g. an upstream row without an
+    output price, are skipped with a warning instead of failing the merge.
+    """
+    for row in rows:
+        if isinstance(row, PriceEntry):
+            yield row
+            continue
+        try:
+            entry = PriceEntry.from_dict(row)
+        except ValueError as e:
+            logger.warning("Skipped invalid %s", e)
+            inc("rows_skipped")
+            continue
+        yield entry
+
+
+def to_json(obj):
+    """`default` hook for json.dump(s) serializing entries as plain rows."""
+    if isinstance(obj, PriceEntry):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
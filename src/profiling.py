@@ -0,0 +1,159 @@
+"""
+Opt-in cProfile and tracemalloc profiling of pipeline stages.
+
+Profiling is off by default. Enable it for some stages with
+`python src/pipeline.py --profile merge siliconflow` (or `--profile all`), or
+with $PROFILE="merge,siliconflow". For each profiled stage three files are
+written to $PROFILE_DIR ("profiles" next to the outputs by default):
+
+- <stage>.pstats: the cProfile statistics, for `python -m pstats`, snakeviz...
+- <stage>.prof.txt: the $PROFILE_TOP (25) functions with the most cumulative time
+- <stage>.alloc.txt: peak traced memory and the $PROFILE_TOP source lines that
+  allocated the most memory during the stage and still held it at the end
+
+cProfile only sees the thread running the stage, so the work of the HTTP and
+YAML worker pools shows up as waiting; tracemalloc counts the allocations of
+all threads. Profiled stages run one at a time so that their reports do not
+mix, stages that are not profiled still run concurrently.
+"""
+
+import io
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Optional
+
+from lazy_import import lazy_import
+
+# only loaded when a stage is profiled
+cProfile = lazy_import("cProfile")
+pstats = lazy_import("pstats")
+tracemalloc = lazy_import("tracemalloc")
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "25"))
+# frames stored per allocation; more frames give better tracebacks but cost
+# more memory and time
+PROFILE_FRAMES = int(os.getenv("PROFILE_FRAMES", "1"))
+
+_settings = {"stages": frozenset(), "directory": PROFILE_DIR, "top": PROFILE_TOP}
+_lock = threading.Lock()
+
+# left out of the allocation reports, besides tracemalloc itself
+_IGNORED_FILES = (
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+)
+
+
+def parse_stages(value: Optional[str]) -> list:
+    """Split a comma-separated list of stage names, e.g. $PROFILE."""
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def configure_profiling(
+    stages: Iterable[str], directory: str = None, top: int = None
+) -> None:
+    """
+    Choose the stages to profile.
+
+    Args:
+        stages (Iterable[str]): Stage names, "all" profiles every stage.
+        directory (str, optional): Where the reports are written
+            (default: $PROFILE_DIR).
+        top (int, optional): Number of functions and source lines in the text
+            reports (default: $PROFILE_TOP).
+    """
+    _settings["stages"] = frozenset(stages or ())
+    _settings["directory"] = directory or PROFILE_DIR
+    _settings["top"] = PROFILE_TOP if top is None else top
+
+
+def profiling_enabled(name: str) -> bool:
+    stages = _settings["stages"]
+    return name in stages or "all" in stages
+
+
+def _format_size(size: int) -> str:
+    value = float(size)
+    for unit in ("B", "KiB", "MiB"):
+        if abs(value) < 1024:
+            break
+        value /= 1024
+    else:
+        unit = "GiB"
+    return f"{value:.1f} {unit}"
+
+
+def _write_reports(name, profiler, before, after, peak) -> str:
+    directory, top = _settings["directory"], _settings["top"]
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, name)
+
+    profiler.dump_stats(f"{base}.pstats")
+    text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=text)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    with open(f"{base}.prof.txt", "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+
+    filters = [
+        tracemalloc.Filter(False, file_name)
+        for file_name in (tracemalloc.__file__,) + _IGNORED_FILES
+    ]
+    diffs = after.filter_traces(filters).compare_to(
+        before.filter_traces(filters), "lineno"
+    )
+    net = sum(diff.size_diff for diff in diffs)
+    lines = [
+        f"stage {name}: peak traced memory {_format_size(peak)}, "
+        f"net {_format_size(net)} still allocated at the end",
+        "",
+        f"Top {top} source lines by memory allocated during the stage:",
+    ]
+    for rank, diff in enumerate(diffs[:top], 1):
+        frame = diff.traceback[0]
+        lines.append(
+            f"#{rank}: {frame.filename}:{frame.lineno}: "
+            f"{_format_size(diff.size_diff)} in {diff.count_diff:+d} blocks"
+        )
+        for line in diff.traceback.format()[1:]:
+            lines.append(f"    {line.strip()}")
+    with open(f"{base}.alloc.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return base
+
+
+@contextmanager
+def profile(name: str):
+    """
+    Profile the enclosed block with cProfile and tracemalloc if `name` is one of
+    the configured stages, and write its reports when it ends (also if it
+    raises). Does nothing otherwise.
+    """
+    if not profiling_enabled(name):
+        yield
+        return
+
+    with _lock:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(PROFILE_FRAMES)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            if started:
+                tracemalloc.stop()
+            base = _write_reports(name, profiler, before, after, peak)
+            print(f"[profile] {name}: {base}.pstats, {base}.prof.txt, {base}.alloc.txt")
+
+
+configure_profiling(parse_stages(os.getenv("PROFILE")))
@@ -1,10 +1,18 @@
 import argparse
+import hashlib
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple
 
-import requests
-import yaml
+import http_client
+from fetch import DEFAULT_TIMEOUT
+from lazy_import import lazy_import
+from metrics import timed
+
+requests = lazy_import("requests")
+
+OWNEDBY_WORKERS = int(os.getenv("OWNEDBY_WORKERS", "8"))
 
 
 def load_ownedby(json_file_path: str = None, url: str = None) -> List:
@@ -31,10 +39,23 @@ def load_ownedby(json_file_path: str = None, url: str = None) -> List:
         with open(json_file_path, "r", encoding="utf-8") as file:
             raw_ownedby = json.load(file)["data"]
     elif url:
-        response = requests.get(url)
+        response = http_client.get(url, timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()
         raw_ownedby = response.json()["data"]
 
+    return index_ownedby(raw_ownedby)
+
+
+def index_ownedby(raw_ownedby: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Index raw ownedby data (keyed by id) by entry name, dropping unnamed entries.
+
+    Args:
+        raw_ownedby (Dict[str, Dict]): The "data" mapping of an ownedby payload.
+
+    Returns:
+        Dict[str, Dict]: Ownedby entries keyed by name.
+    """
     ownedby_data = {}
     # ownedby_data = {each["name"]: each for each in raw_ownedby.values() if each['name'] != "" else continue}
     for each in raw_ownedby.values():
@@ -45,9 +66,22 @@ def load_ownedby(json_file_path: str = None, url: str = None) -> List:
     return ownedby_data
 
 
+def canonical_hash(entry: Dict) -> str:
+    """Hash of an entry that does not depend on key order or formatting."""
+    canonical = json.dumps(entry, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def hash_ownedby(ownedby_data: Dict[str, Dict]) -> Dict[str, str]:
+    """Canonical hash of every entry, keyed by name."""
+    return {name: canonical_hash(entry) for name, entry in ownedby_data.items()}
+
+
 def update_ownedby(
     ownedby_original: Dict[str, Dict[str, str]],
     ownedby_manual: Dict[str, Dict[str, str]],
+    hashes_original: Dict[str, str] = None,
+    hashes_manual: Dict[str, str] = None,
 ) -> Dict[str, List]:
     """
     Compare original and manual versions and derive a list of to_delete and to_add.
@@ -55,10 +89,18 @@ def update_ownedby(
     Args:
         ownedby_original (Dict[str, Dict[str, str]]): Original ownedby data.
         ownedby_manual (Dict[str, Dict[str, str]]): Manual ownedby data.
+        hashes_original (Dict[str, str], optional): Precomputed `hash_ownedby`
+            of the original data.
+        hashes_manual (Dict[str, str], optional): Precomputed `hash_ownedby` of
+            the manual data.
 
     Returns:
         Dict[str, List]: A dictionary containing lists of entries to delete and add.
     """
+    if hashes_original is None:
+        hashes_original = hash_ownedby(ownedby_original)
+    if hashes_manual is None:
+        hashes_manual = hash_ownedby(ownedby_manual)
     to_delete = []
     to_add = []
 
@@ -71,10 +113,7 @@ def update_ownedby(
     to_add.extend(names_manual - names_original)
     # find all names in both but with different values
     for name in names_original & names_manual:
-        # compare by the jsonified dict content
-        if json.dumps(ownedby_original[name], sort_keys=True) != json.dumps(
-            ownedby_manual[name], sort_keys=True
-        ):
+        if hashes_original[name] != hashes_manual[name]:
             to_delete.append(name)
             to_add.append(name)
 
@@ -84,7 +123,8 @@ def update_ownedby(
     return {"to_delete": to_delete, "to_add": to_add}
 
 
-def delete_ownedby(api_url: str, admin_token: str, ownedby_id: str) -> None:
+@timed("sync", kind="ownedby", op="delete")
+def delete_ownedby(api_url: str, admin_token: str, ownedby_id: str) -> bool:
     """
     Sends a DELETE request to the ownedby endpoint to delete data.
 
@@ -94,20 +134,24 @@ def delete_ownedby(api_url: str, admin_token: str, ownedby_id: str) -> None:
         ownedby_id (str): ID of the ownedby entry to delete.
 
     Returns:
-        None
+        bool: Whether the entry was deleted.
     """
     headers = {
         "Authorization": f"Bearer {admin_token}",
     }
-    response = requests.delete(f"{api_url}/{ownedby_id}", headers=headers)
+    response = http_client.delete(
+        f"{api_url}/{ownedby_id}", headers=headers, timeout=DEFAULT_TIMEOUT
+    )
 
     if response.status_code == 200:
         print("Delete successful:", response.json())
-    else:
-        print("Delete failed:", response.status_code, response.text)
+        return True
+    print("Delete failed:", response.status_code, response.text)
+    return False
 
 
-def add_ownedby(api_url: str, admin_token: str, ownedby_data: Dict) -> None:
+@timed("sync", kind="ownedby", op="add")
+def add_ownedby(api_url: str, admin_token: str, ownedby_data: Dict) -> bool:
     """
     Sends a POST request to the ownedby endpoint to add data.
 
@@ -117,21 +161,110 @@ def add_ownedby(api_url: str, admin_token: str, ownedby_data: Dict) -> None:
         ownedby_data (Dict): Dictionary containing ownedby data to add.
 
     Returns:
-        None
+        bool: Whether the entry was added.
     """
     headers = {
         "Authorization": f"Bearer {admin_token}",
         "Content-Type": "application/json",
     }
-    response = requests.post(api_url, json=ownedby_data, headers=headers)
+    response = http_client.post(
+        api_url, json=ownedby_data, headers=headers, timeout=DEFAULT_TIMEOUT
+    )
 
     if response.status_code == 200:
         print("Add successful:", response.json())
-    else:
-        print("Add failed:", response.status_code, response.text)
+        return True
+    print("Add failed:", response.status_code, response.text)
+    return False
 
 
-if __name__ == "__main__":
+def apply_ownedby_updates(
+    api_url: str,
+    admin_token: str,
+    ownedby_updates: Dict[str, List],
+    workers: int = None,
+) -> Dict[str, List]:
+    """
+    Apply to_delete / to_add lists concurrently.
+
+    Operations on the same id run in order, deletes first, so a changed entry
+    is removed before it is added back; different ids run in parallel.
+
+    Args:
+        api_url (str): Base URL of the API (e.g., 'http://localhost:8080/api/model_ownedby').
+        admin_token (str): Admin authentication token.
+        ownedby_updates (Dict[str, List]): The result of `update_ownedby`.
+        workers (int, optional): Concurrent requests (default: $OWNEDBY_WORKERS).
+
+    Returns:
+        Dict[str, List]: The entries that were deleted, added, and the
+        operations that failed.
+    """
+    operations: Dict[str, List[Tuple[str, Dict]]] = {}
+    for each in ownedby_updates["to_delete"]:
+        operations.setdefault(str(each["id"]), []).append(("delete", each))
+    for each in ownedby_updates["to_add"]:
+        operations.setdefault(str(each["id"]), []).append(("add", each))
+
+    def apply(ops: List[Tuple[str, Dict]]) -> List[Tuple[str, Dict, bool, str]]:
+        results = []
+        for op, each in ops:
+            try:
+                if op == "delete":
+                    ok = delete_ownedby(api_url, admin_token, each["id"])
+                else:
+                    ok = add_ownedby(api_url, admin_token, each)
+                error = "" if ok else "rejected by server"
+            except requests.exceptions.RequestException as e:
+                print(f"{op.capitalize()} failed:", e)
+                ok, error = False, str(e)
+            results.append((op, each, ok, error))
+        return results
+
+    summary = {"deleted": [], "added": [], "failed": []}
+    with ThreadPoolExecutor(max_workers=max(1, workers or OWNEDBY_WORKERS)) as executor:
+        for results in executor.map(apply, operations.values()):
+            for op, each, ok, error in results:
+                if ok:
+                    summary["deleted" if op == "delete" else "added"].append(each)
+                else:
+                    summary["failed"].append({"op": op, "entry": each, "error": error})
+
+    print(
+        f"ownedby sync: {len(summary['deleted'])} deleted, "
+        f"{len(summary['added'])} added, {len(summary['failed'])} failed"
+    )
+    return summary
+
+
+def sync_ownedby(
+    api_url: str,
+    admin_token: str,
+    ownedby_original: Dict[str, Dict[str, str]],
+    ownedby_manual: Dict[str, Dict[str, str]],
+) -> Dict[str, List]:
+    """
+    Diff original against manual ownedby data and apply the changes to the API.
+
+    Args:
+        api_url (str): Base URL of the API (e.g., 'http://localhost:8080/api/model_ownedby').
+        admin_token (str): Admin authentication token.
+        ownedby_original (Dict[str, Dict[str, str]]): Original ownedby data.
+        ownedby_manual (Dict[str, Dict[str, str]]): Manual ownedby data.
+
+    Returns:
+        Dict[str, List]: The to_delete and to_add lists, and the deleted, added
+        and failed results of applying them.
+    """
+    ownedby_updates = update_ownedby(ownedby_original, ownedby_manual)
+
+    print(json.dumps(ownedby_updates, indent=4, ensure_ascii=False, sort_keys=False))
+
+    ownedby_updates.update(apply_ownedby_updates(api_url, admin_token, ownedby_updates))
+    return ownedby_updates
+
+
+def main() -> None:
     from dotenv import load_dotenv
 
     load_dotenv()  # Load environment variables from .env file
@@ -165,12 +298,11 @@ if __name__ == "__main__":
     if not args.manual_json and not args.manual_url:
         raise ValueError("Either `manual_json` or `manual_url` must be provided.")
 
-    ONEHUB_URL = os.getenv("ONEHUB_URL").strip("/")
-    API_URL = f"{ONEHUB_URL}/api/model_ownedby"
-    ADMIN_TOKEN = os.getenv("ONEHUB_ADMIN_TOKEN")  # Replace with a valid admin token
+    from sync_targets import load_onehub_targets, sync_ownedby_targets
 
-    assert ONEHUB_URL is not None, "ONEHUB_URL is not set"
-    assert ADMIN_TOKEN is not None, "ONEHUB_ADMIN_TOKEN is not set"
+    TARGETS = (
+        load_onehub_targets()
+    )  # $ONEHUB_TARGETS or $ONEHUB_URL/$ONEHUB_ADMIN_TOKEN
 
     ownedby_original = load_ownedby(
         json_file_path=args.source_json, url=args.source_url
@@ -178,10 +310,12 @@ if __name__ == "__main__":
     ownedby_manual = load_ownedby(json_file_path=args.manual_json, url=args.manual_url)
 
     ownedby_updates = update_ownedby(ownedby_original, ownedby_manual)
-
     print(json.dumps(ownedby_updates, indent=4, ensure_ascii=False, sort_keys=False))
 
-    for each in ownedby_updates["to_delete"]:
-        delete_ownedby(API_URL, ADMIN_TOKEN, each["id"])
-    for each in ownedby_updates["to_add"]:
-        add_ownedby(API_URL, ADMIN_TOKEN, each)
+    _, failed = sync_ownedby_targets(TARGETS, ownedby_updates)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
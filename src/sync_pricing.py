@@ -1,22 +1,30 @@
 import argparse
+import hashlib
 import json
 import os
-from typing import Literal
-
-import dotenv
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Literal, Optional, Tuple
 
+import http_client
+from fetch import DEFAULT_TIMEOUT, fetch
+from lazy_import import lazy_import
+from metrics import timed
+from price_entry import to_json
 from utils import get_channel_id_mapping
 
-dotenv.load_dotenv()  # Load environment variables from .env file
+requests = lazy_import("requests")
 
 
+@timed("sync", kind="prices")
 def sync_pricing(
     api_url: str,
     admin_token: str,
     prices: list,
     update_mode: Literal["system", "add", "update", "overwrite"] = "update",
-) -> None:
+    timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+) -> bool:
     """
     Sends a POST request to the syncPricing endpoint to update pricing data.
 
@@ -25,25 +33,367 @@ def sync_pricing(
         admin_token (str): Admin authentication token.
         prices (list): List of price objects to sync.
         overwrite (Literal["system", "add", "update", "overwrite"]): Whether to overwrite existing prices (default: "update")
+        timeout (tuple, optional): (connect, read) timeout in seconds.
 
     Returns:
-        None
+        bool: Whether the server accepted the prices.
     """
     headers = {
         "Authorization": f"Bearer {admin_token}",
         "Content-Type": "application/json",
     }
     params = {"updateMode": update_mode.lower()}
-    response = requests.post(api_url, json=prices, headers=headers, params=params)
+    body = json.dumps(prices, allow_nan=False, default=to_json).encode("utf-8")
+    response = http_client.post(
+        api_url,
+        data=body,
+        headers=headers,
+        params=params,
+        timeout=timeout,
+        # sending the same prices again with these modes changes nothing
+        idempotent=params["updateMode"] in ("update", "overwrite"),
+    )
 
     if response.status_code == 200:
         print("Sync successful:", response.json())
+        return True
+    print("Sync failed:", response.status_code, response.text)
+    return False
+
+
+# defaults of $SYNC_CHUNK_SIZE and $SYNC_WORKERS, which are read when a sync
+# starts so that a .env loaded by main() applies
+SYNC_CHUNK_SIZE = 500
+SYNC_WORKERS = 4
+# 记录已被服务端接受的分块，重试时跳过；同步全部完成后删除。每个目标地址一个文件
+SYNC_CHECKPOINT_DIR = os.path.join(".cache", "sync_checkpoints")
+SYNC_CHECKPOINT_TTL = 24 * 3600  # seconds
+
+
+def _url_file(directory: str, url: str) -> str:
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{digest}.json")
+
+
+def chunk_digest(api_url: str, update_mode: str, chunk: List[Dict]) -> str:
+    """Identify a chunk upload by its target, mode and content."""
+    digest = hashlib.sha256(f"{api_url}\n{update_mode}\n".encode("utf-8"))
+    digest.update(
+        json.dumps(
+            chunk, sort_keys=True, separators=(",", ":"), default=to_json
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+def _load_checkpoint(file_path: str) -> set:
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return set()
+    if time.time() - checkpoint.get("updated_at", 0) > SYNC_CHECKPOINT_TTL:
+        return set()
+    return set(checkpoint.get("done", []))
+
+
+def _save_checkpoint(file_path: str, done: set) -> None:
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"updated_at": time.time(), "done": sorted(done)}, f)
+    os.replace(tmp_path, file_path)
+
+
+def sync_pricing_chunked(
+    api_url: str,
+    admin_token: str,
+    prices: List[Dict],
+    update_mode: Literal["system", "add", "update", "overwrite"] = "update",
+    chunk_size: int = None,
+    workers: int = None,
+    checkpoint_file: str = None,
+) -> bool:
+    """
+    Sync prices in chunks, several at a time, resuming after a failed attempt.
+
+    Every accepted chunk is recorded in the checkpoint file, so calling this
+    again with the same prices only sends the chunks that have not been
+    accepted yet. The checkpoint is removed once all chunks went through.
+
+    "overwrite" replaces the whole price table, so it is sent as a single
+    request: split into chunks, the table would hold only the first chunk until
+    the others arrived, and stay truncated if one of them failed.
+
+    Args:
+        api_url (str): Base URL of the API (e.g., 'http://localhost:8080/api/prices/sync').
+        admin_token (str): Admin authentication token.
+        prices (List[Dict]): List of price objects to sync.
+        update_mode (Literal["system", "add", "update", "overwrite"], optional):
+            How the server applies the prices (default: "update").
+        chunk_size (int, optional): Prices per request (default: $SYNC_CHUNK_SIZE).
+        workers (int, optional): Concurrent requests (default: $SYNC_WORKERS).
+        checkpoint_file (str, optional): Where accepted chunks are recorded
+            (default: a file per `api_url` in SYNC_CHECKPOINT_DIR).
+
+    Returns:
+        bool: Whether all chunks were accepted.
+    """
+    chunk_size = max(
+        1, chunk_size or int(os.getenv("SYNC_CHUNK_SIZE", SYNC_CHUNK_SIZE))
+    )
+    workers = max(1, workers or int(os.getenv("SYNC_WORKERS", SYNC_WORKERS)))
+    update_mode = update_mode.lower()
+    if update_mode == "overwrite":
+        chunk_size = max(chunk_size, len(prices))
+
+    chunks = [prices[i : i + chunk_size] for i in range(0, len(prices), chunk_size)]
+    if not chunks:
+        return True
+    digests = [chunk_digest(api_url, update_mode, chunk) for chunk in chunks]
+
+    checkpoint_file = checkpoint_file or _url_file(SYNC_CHECKPOINT_DIR, api_url)
+    done = _load_checkpoint(checkpoint_file)
+    lock = threading.Lock()
+    skipped = sum(digest in done for digest in digests)
+    if skipped:
+        print(f"Resuming price sync: {skipped}/{len(chunks)} chunks already accepted")
+
+    def send(index: int) -> bool:
+        if digests[index] in done:
+            return True
+        try:
+            ok = sync_pricing(api_url, admin_token, chunks[index], update_mode)
+        except requests.exceptions.RequestException as e:
+            print(f"Sync of chunk {index + 1}/{len(chunks)} failed: {e}")
+            return False
+        if ok:
+            with lock:
+                done.add(digests[index])
+                _save_checkpoint(checkpoint_file, done)
+        return ok
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(send, range(len(chunks))))
+    if not all(results):
+        return False
+
+    try:
+        os.remove(checkpoint_file)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+# 上次成功同步的价格，可代替从 OneHub 拉取当前价格
+PRICE_SNAPSHOT_DIR = os.path.join(".cache", "last_synced_prices")
+
+
+def price_key(price: Dict) -> Tuple[str, int]:
+    """Identity of a price row on the OneHub side."""
+    return price["model"], price["channel_type"]
+
+
+def _price_value(price: Dict) -> Tuple:
+    # 服务端可能省略空的 extra_ratios，数值也可能是 int，统一后再比较
+    return (
+        price.get("type"),
+        float(price.get("input") or 0),
+        float(price.get("output") or 0),
+        json.dumps(price.get("extra_ratios") or {}, sort_keys=True),
+    )
+
+
+def plan_price_sync(prices: List[Dict], current: List[Dict]) -> Dict[str, List]:
+    """
+    Diff the desired prices against the prices currently on the server.
+
+    Args:
+        prices (List[Dict]): The prices that should be on the server.
+        current (List[Dict]): The prices that are on the server.
+
+    Returns:
+        Dict[str, List]: Rows to add (not on the server), to update (on the
+        server with different values) and to delete (only on the server).
+    """
+    current_by_key = {price_key(price): price for price in current}
+    wanted = set()
+    to_add = []
+    to_update = []
+    for price in prices:
+        key = price_key(price)
+        wanted.add(key)
+        existing = current_by_key.get(key)
+        if existing is None:
+            to_add.append(price)
+        elif _price_value(existing) != _price_value(price):
+            to_update.append(price)
+    to_delete = [price for key, price in current_by_key.items() if key not in wanted]
+
+    return {"to_add": to_add, "to_update": to_update, "to_delete": to_delete}
+
+
+def fetch_synced_prices(onehub_url: str, admin_token: str) -> List[Dict]:
+    """
+    Fetch the prices currently configured on a OneHub instance.
+
+    Args:
+        onehub_url (str): Base URL of OneHub (e.g., 'http://localhost:8080').
+        admin_token (str): Admin authentication token.
+
+    Returns:
+        List[Dict]: The price rows.
+    """
+    response = fetch(
+        f"{onehub_url}/api/prices",
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    payload = response.json()
+    if isinstance(payload, dict):
+        return payload.get("data") or []
+    return payload
+
+
+def load_price_snapshot(onehub_url: str, file_path: str = None) -> Optional[List[Dict]]:
+    """
+    Load the prices last synced to `onehub_url`.
+
+    Returns:
+        Optional[List[Dict]]: The prices, or None if there is no snapshot for
+        this server.
+    """
+    file_path = file_path or _url_file(PRICE_SNAPSHOT_DIR, onehub_url)
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if snapshot.get("url") != onehub_url:
+        return None
+    return snapshot["data"]
+
+
+def save_price_snapshot(
+    onehub_url: str, prices: List[Dict], file_path: str = None
+) -> None:
+    """Remember `prices` as the prices last synced to `onehub_url`."""
+    file_path = file_path or _url_file(PRICE_SNAPSHOT_DIR, onehub_url)
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"url": onehub_url, "data": prices}, f, ensure_ascii=False, default=to_json
+        )
+    os.replace(tmp_path, file_path)
+
+
+def sync_pricing_delta(
+    onehub_url: str,
+    admin_token: str,
+    prices: List[Dict],
+    source: Literal["server", "snapshot"] = "server",
+    snapshot_file: str = None,
+) -> Dict[str, List]:
+    """
+    Push only the prices that differ from what is on the server.
+
+    New rows are sent with the "add" mode and changed rows with the "update"
+    mode. The sync endpoint cannot delete single rows, so if rows have to be
+    removed the whole list is sent in one "overwrite" request instead.
+
+    Args:
+        onehub_url (str): Base URL of OneHub (e.g., 'http://localhost:8080').
+        admin_token (str): Admin authentication token.
+        prices (List[Dict]): The prices that should be on the server.
+        source (Literal["server", "snapshot"], optional): Diff against the prices
+            fetched from the server, or against the last synced snapshot (no
+            request; falls back to the server if there is no snapshot).
+        snapshot_file (str, optional): Where the last synced prices are kept
+            (default: a file per `onehub_url` in PRICE_SNAPSHOT_DIR).
+
+    Returns:
+        Dict[str, List]: The to_add, to_update and to_delete rows.
+
+    Raises:
+        RuntimeError: If the server rejected a request.
+    """
+    current = None
+    if source == "snapshot":
+        current = load_price_snapshot(onehub_url, snapshot_file)
+        if current is None:
+            print("No price snapshot found, fetching the current prices from OneHub.")
+    if current is None:
+        current = fetch_synced_prices(onehub_url, admin_token)
+
+    plan = plan_price_sync(prices, current)
+    print(
+        f"Price sync plan: {len(plan['to_add'])} to add, "
+        f"{len(plan['to_update'])} to update, {len(plan['to_delete'])} to delete, "
+        f"{len(prices) - len(plan['to_add']) - len(plan['to_update'])} unchanged"
+    )
+
+    api_url = f"{onehub_url}/api/prices/sync"
+    ok = True
+    if plan["to_delete"]:
+        ok = sync_pricing_chunked(api_url, admin_token, prices, "overwrite")
     else:
-        print("Sync failed:", response.status_code, response.text)
+        if plan["to_add"]:
+            ok = sync_pricing_chunked(api_url, admin_token, plan["to_add"], "add")
+        if plan["to_update"]:
+            ok = (
+                sync_pricing_chunked(api_url, admin_token, plan["to_update"], "update")
+                and ok
+            )
+    if not ok:
+        raise RuntimeError("OneHub rejected the price sync")
+
+    save_price_snapshot(onehub_url, prices, snapshot_file)
+    return plan
+
+
+def push_prices(
+    onehub_url: str,
+    admin_token: str,
+    prices: List[Dict],
+    update_mode: str = "delta",
+    delta_source: Literal["server", "snapshot"] = "server",
+) -> Dict[str, List]:
+    """
+    Sync prices to a OneHub instance with the given update mode.
+
+    Args:
+        onehub_url (str): Base URL of OneHub (e.g., 'http://localhost:8080').
+        admin_token (str): Admin authentication token.
+        prices (List[Dict]): The prices to sync.
+        update_mode (str, optional): "delta", or one of the sync endpoint's
+            modes ("system", "add", "update", "overwrite").
+        delta_source (Literal["server", "snapshot"], optional): What the
+            "delta" mode diffs against.
+
+    Returns:
+        Dict[str, List]: The delta plan, or all prices as to_add/to_update for
+        the other modes.
+
+    Raises:
+        RuntimeError: If the server rejected a request.
+    """
+    if update_mode == "delta":
+        return sync_pricing_delta(onehub_url, admin_token, prices, delta_source)
+    if not sync_pricing_chunked(
+        f"{onehub_url}/api/prices/sync", admin_token, prices, update_mode
+    ):
+        raise RuntimeError("OneHub rejected the price sync")
+    pushed = {"to_add": [], "to_update": [], "to_delete": []}
+    pushed["to_update" if update_mode == "update" else "to_add"] = prices
+    return pushed
 
 
 # Example usage
 def main() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()  # Load environment variables from .env file
+
     parser = argparse.ArgumentParser(description="Sync pricing data.")
     parser.add_argument(
         "--json_file",
@@ -61,19 +411,17 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    ONEHUB_URL = os.getenv("ONEHUB_URL").strip("/")
-    API_URL = f"{ONEHUB_URL}/api/prices/sync"
-    ADMIN_TOKEN = os.getenv("ONEHUB_ADMIN_TOKEN")  # Replace with a valid admin token
-    UPDATE_MODE = os.getenv("SYNC_PRICE_UPDATE_MODE", "overwrite")
+    from sync_targets import load_onehub_targets, sync_pricing_targets
 
-    assert ONEHUB_URL is not None, "ONEHUB_URL is not set"
-    assert ADMIN_TOKEN is not None, "ONEHUB_ADMIN_TOKEN is not set"
+    TARGETS = (
+        load_onehub_targets()
+    )  # $ONEHUB_TARGETS or $ONEHUB_URL/$ONEHUB_ADMIN_TOKEN
+    UPDATE_MODE = os.getenv("SYNC_PRICE_UPDATE_MODE", "delta")
+    DELTA_SOURCE = os.getenv("SYNC_PRICE_DELTA_SOURCE", "server")
 
     price_json = None
     if args.json_url:
-        response = requests.get(args.json_url)
-        response.raise_for_status()
-        price_json = response.json()
+        price_json = fetch(args.json_url).json()
     else:
         with open(args.json_file, "r") as f:
             price_json = json.load(f)
@@ -86,10 +434,12 @@ def main() -> None:
         prices = []
     print(prices)
 
-    sync_pricing(API_URL, ADMIN_TOKEN, prices, UPDATE_MODE)
+    _, failed = sync_pricing_targets(TARGETS, prices, UPDATE_MODE, DELTA_SOURCE)
 
     # download the latest ownedby.json to local for git purpose
     get_channel_id_mapping(save_to_file=True)
+    if failed:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,216 @@
+"""
+Sync prices and ownedby data to several OneHub instances at once.
+
+The instances are read from $ONEHUB_TARGETS, a JSON list such as
+
+    [{"name": "main", "url": "https://onehub.a.link", "token": "..."},
+     {"name": "backup", "url": "https://onehub.b.link", "token": "..."}]
+
+and default to the single $ONEHUB_URL / $ONEHUB_ADMIN_TOKEN instance. The
+prices and the ownedby diff are computed once and pushed to all instances
+concurrently; every instance gets its own status, and an instance that fails or
+does not finish within the timeout does not hold up or fail the others.
+
+A sync that does not finish within the timeout cannot be cancelled: its thread
+keeps running and may outlive the stage. Until it ends, the instance is not
+synced again (a retried stage reports it as failed), so two syncs never write
+the same checkpoints and digests at once.
+
+The digest of the prices last synced to each instance is kept in the digest
+store (see `artifacts`), and instances that already have the same prices are
+skipped without any request.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Tuple
+
+from artifacts import get_digest_store, json_digest
+from sync_ownedby import apply_ownedby_updates
+from sync_pricing import push_prices
+
+# seconds one instance may take for a sync, across all of its requests; default
+# of $ONEHUB_TARGET_TIMEOUT, which is read per sync so that a .env loaded by
+# main() applies
+TARGET_TIMEOUT = 600.0
+
+# url -> sync that outlived its fan_out and is still running
+_stragglers: Dict[str, Future] = {}
+_stragglers_lock = threading.Lock()
+
+
+class OneHubTarget:
+    """A OneHub instance to sync to."""
+
+    def __init__(self, url: str, token: str, name: str = None):
+        self.url = url.strip("/")
+        self.token = token
+        self.name = name or self.url
+
+    def __repr__(self) -> str:
+        return f"OneHubTarget({self.name!r}, {self.url!r})"
+
+
+def load_onehub_targets() -> List[OneHubTarget]:
+    """
+    Read the OneHub instances from the environment.
+
+    Returns:
+        List[OneHubTarget]: The instances in $ONEHUB_TARGETS, or the one given by
+        $ONEHUB_URL and $ONEHUB_ADMIN_TOKEN.
+
+    Raises:
+        ValueError: If $ONEHUB_TARGETS is malformed or no instance is configured.
+    """
+    raw_targets = os.getenv("ONEHUB_TARGETS")
+    if raw_targets:
+        try:
+            entries = json.loads(raw_targets)
+            targets = [
+                OneHubTarget(entry["url"], entry["token"], entry.get("name"))
+                for entry in entries
+            ]
+        except (ValueError, TypeError, KeyError) as e:
+            raise ValueError(f"ONEHUB_TARGETS is malformed: {e}") from e
+        names = [target.name for target in targets]
+        if len(set(names)) != len(names):
+            raise ValueError("ONEHUB_TARGETS contains duplicate names")
+        if targets:
+            return targets
+
+    onehub_url = os.getenv("ONEHUB_URL")
+    admin_token = os.getenv("ONEHUB_ADMIN_TOKEN")
+    if not onehub_url:
+        raise ValueError("Neither ONEHUB_TARGETS nor ONEHUB_URL is set")
+    if not admin_token:
+        raise ValueError("ONEHUB_ADMIN_TOKEN is not set")
+    return [OneHubTarget(onehub_url, admin_token)]
+
+
+def fan_out(
+    targets: List[OneHubTarget],
+    func: Callable[[OneHubTarget], object],
+    timeout: float = None,
+) -> Tuple[Dict[str, object], Dict[str, Exception]]:
+    """
+    Call `func` for every target concurrently.
+
+    Args:
+        targets (List[OneHubTarget]): The instances.
+        func (Callable[[OneHubTarget], object]): The sync to run per instance.
+        timeout (float, optional): Seconds to wait for all instances; those that
+            have not finished by then are reported as failed (default:
+            $ONEHUB_TARGET_TIMEOUT, 600). Their threads keep running, and
+            their instances are reported as failed without being synced by
+            later calls until they end.
+
+    Returns:
+        Tuple[Dict[str, object], Dict[str, Exception]]: Results of the instances
+        that succeeded and errors of those that failed, keyed by target name.
+    """
+    if timeout is None:
+        timeout = float(os.getenv("ONEHUB_TARGET_TIMEOUT", TARGET_TIMEOUT))
+    results: Dict[str, object] = {}
+    failed: Dict[str, Exception] = {}
+    if not targets:
+        return results, failed
+
+    with _stragglers_lock:
+        for url, future in list(_stragglers.items()):
+            if future.done():
+                del _stragglers[url]
+        busy = {target.url for target in targets if target.url in _stragglers}
+    for target in targets:
+        if target.url in busy:
+            failed[target.name] = RuntimeError(
+                "a sync that timed out earlier is still running"
+            )
+    runnable = [target for target in targets if target.url not in busy]
+
+    executor = ThreadPoolExecutor(max_workers=max(1, len(runnable)))
+    start = time.perf_counter()
+    futures = {executor.submit(func, target): target for target in runnable}
+    done, not_done = wait(futures, timeout=timeout)
+    # requests have their own timeouts, do not block on stragglers
+    executor.shutdown(wait=False)
+
+    for future, target in futures.items():
+        if future in not_done:
+            with _stragglers_lock:
+                _stragglers[target.url] = future
+            failed[target.name] = TimeoutError(f"no result after {timeout:g}s")
+            continue
+        try:
+            results[target.name] = future.result()
+        except Exception as e:
+            failed[target.name] = e
+
+    elapsed = time.perf_counter() - start
+    for target in targets:
+        status = "ok" if target.name in results else f"FAILED ({failed[target.name]})"
+        print(f"[{target.name}] {status}")
+    print(f"Synced {len(results)}/{len(targets)} OneHub instances in {elapsed:.2f}s")
+    return results, failed
+
+
+def sync_pricing_targets(
+    targets: List[OneHubTarget],
+    prices: List[Dict],
+    update_mode: str = "delta",
+    delta_source: str = "server",
+    timeout: float = None,
+    force: bool = False,
+) -> Tuple[Dict[str, object], Dict[str, Exception]]:
+    """
+    Push the same prices to every instance (see `sync_pricing.push_prices`).
+
+    Args:
+        force (bool, optional): Also sync instances whose last successful sync
+            had the same prices.
+
+    Returns:
+        Tuple[Dict[str, object], Dict[str, Exception]]: Per-instance sync plans
+        (None for skipped instances) and errors.
+    """
+    store = get_digest_store()
+    digest = json_digest(prices)
+
+    def push(target: OneHubTarget):
+        key = f"synced:{target.url}"
+        if not force and store.get(key) == digest:
+            print(f"[{target.name}] prices unchanged since the last sync, skipped")
+            return None
+        plan = push_prices(target.url, target.token, prices, update_mode, delta_source)
+        store.put({key: digest})
+        return plan
+
+    return fan_out(targets, push, timeout)
+
+
+def sync_ownedby_targets(
+    targets: List[OneHubTarget],
+    ownedby_updates: Dict[str, List],
+    timeout: float = None,
+) -> Tuple[Dict[str, object], Dict[str, Exception]]:
+    """
+    Apply the same ownedby diff (see `sync_ownedby.update_ownedby`) to every instance.
+
+    An instance for which some operations were rejected is reported as failed.
+
+    Returns:
+        Tuple[Dict[str, object], Dict[str, Exception]]: Per-instance applied
+        results and errors.
+    """
+
+    def apply(target: OneHubTarget):
+        summary = apply_ownedby_updates(
+            f"{target.url}/api/model_ownedby", target.token, ownedby_updates
+        )
+        if summary["failed"]:
+            raise RuntimeError(f"{len(summary['failed'])} ownedby operations failed")
+        return summary
+
+    return fan_out(targets, apply, timeout)
@@ -1,19 +1,71 @@
+import hashlib
+import heapq
 import json
 import os
-from typing import Dict, List, Literal, Tuple
-
-import requests
-import yaml
+import pickle
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterator, List, Literal, Tuple
+
+from artifacts import write_json_artifact
+from fetch import fetch, fetch_stream
+from json_stream import iter_json_array
+from lazy_import import lazy_import
+from metrics import inc, span
+from price_entry import PriceEntry
+
+requests = lazy_import("requests")
+yaml = lazy_import("yaml")
+# numpy is optional, only used for batched price conversion
+np = lazy_import("numpy", optional=True)
 
 SCALE_FACTOR_CNY = 0.014
 SCALE_FACTOR_USD = 0.002
 
+PRICE_PATTERN = re.compile(r"^([\d.]+)\s*(.*)$")
+
+# worker processes used to parse manual price files; 0 or 1 parses in-process
+YAML_WORKERS = int(os.getenv("YAML_WORKERS", "0"))
+
+# upstream URLs can be overridden, e.g. to point them at a local stand-in server
+OWNEDBY_URL = os.getenv("OWNEDBY_URL", "https://oneapi.service.oaklight.cn/api/ownedby")
+CHANNEL_ID_MAPPING_CACHE = os.path.join(".cache", "channel_id_mapping.json")
+CHANNEL_ID_MAPPING_TTL = 6 * 3600  # seconds, matches the update schedule
+
+# process-wide memo of the channel id mapping: (fetched_at, mapping)
+_channel_id_mapping = None
+_channel_id_mapping_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def yaml_loader():
+    """libyaml's C loader if available, it is much faster than the pure-Python one."""
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def round_to_five(num: float) -> float:
     """Round number to 5 decimal places for better precision display."""
     return round(num * 100000) / 100000
 
 
+def round_to_five_array(values: "np.ndarray") -> list:
+    """
+    Vectorized round_to_five, giving bit-identical results.
+
+    Both round half to even, and dividing the integral float is as exact as the
+    scalar int division. Adding 0.0 turns the -0.0 numpy keeps into 0.0.
+
+    Args:
+        values (np.ndarray): float64 prices.
+
+    Returns:
+        list: Rounded prices as Python floats.
+    """
+    return (np.rint(values * 100000) / 100000 + 0.0).tolist()
+
+
 def fetch_and_sort_models(
     url: str,
     endpoint: str,
@@ -38,17 +90,12 @@ def fetch_and_sort_models(
     requests.exceptions.RequestException: For other HTTP errors.
     """
     try:
-        response = requests.get(f"{url}{endpoint}", headers=headers)
-        response.raise_for_status()  # Raise exception for HTTP error responses
-        body = response.text
-
-        if mode == "siliconflow":
-            model_json = json.loads(body)["data"]["models"]
-            model_json = sorted(model_json, key=lambda x: x["modelName"])
-        else:
-            model_json = json.loads(body)["data"]
+        # Raises for HTTP error responses and times out instead of hanging
+        response = fetch(f"{url}{endpoint}", headers=headers, cache=True)
 
-        return model_json
+        with span("parse", source=mode):
+            payload = response.json()
+        return sort_models(payload, mode)
 
     except requests.ConnectionError as e:
         raise requests.ConnectionError(f"Failed to connect to {url}: {e}")
@@ -62,6 +109,58 @@ def fetch_and_sort_models(
         raise requests.exceptions.RequestException(f"An HTTP error occurred: {e}")
 
 
+def stream_models(
+    url: str,
+    endpoint: str,
+    headers: dict[str, str],
+    mode: Literal["siliconflow", "openrouter"],
+) -> Iterator[dict]:
+    """
+    Streams models from the given URL one at a time, without holding the whole
+    response body or the parsed payload in memory.
+
+    Unlike fetch_and_sort_models, siliconflow models are not sorted; the order
+    does not matter once they are integrated and sorted by sort_prices.
+
+    Parameters:
+    url (str): The base URL for the HTTPS connection.
+    endpoint (str): The endpoint to send the GET request to.
+    headers (dict): Dictionary containing any necessary headers.
+    mode (Literal): The mode, either "siliconflow" or "openrouter".
+
+    Yields:
+    dict: The models, in response order.
+
+    Raises:
+    requests.exceptions.RequestException: For HTTP errors.
+    ValueError: If the response body is not valid JSON.
+    KeyError: If the response has no model list.
+    """
+    path = ("data", "models") if mode == "siliconflow" else ("data",)
+    chunks = fetch_stream(f"{url}{endpoint}", headers=headers, cache=True)
+    yield from iter_json_array(chunks, path)
+
+
+def sort_models(payload: dict, mode: Literal["siliconflow", "openrouter"]) -> list:
+    """
+    Extract the model list from a decoded upstream payload.
+
+    Parameters:
+    payload (dict): The decoded JSON response body.
+    mode (Literal): The mode, either "siliconflow" or "openrouter".
+
+    Returns:
+    list: The models, sorted by modelName in siliconflow mode.
+    """
+    if mode == "siliconflow":
+        model_json = payload["data"]["models"]
+        model_json = sorted(model_json, key=lambda x: x["modelName"])
+    else:
+        model_json = payload["data"]
+
+    return model_json
+
+
 def get_channel_id_mapping(save_to_file: bool = False) -> Dict:
     """
     Fetches channel ID mapping data from an external API, optionally saves it to a file,
@@ -71,7 +170,8 @@ def get_channel_id_mapping(save_to_file: bool = False) -> Dict:
     save_to_file (bool): Whether to save the sorted data to a JSON file.
 
     Returns:
-    dict: A mapping of channel names to IDs.
+    dict: A mapping of channel names to IDs, or the sorted ownedby data when
+    `save_to_file` is True.
 
     Raises:
     requests.RequestException: For API request errors.
@@ -79,30 +179,15 @@ def get_channel_id_mapping(save_to_file: bool = False) -> Dict:
     """
     try:
         # Fetch data from the API
-        response = requests.get("https://oneapi.service.oaklight.cn/api/ownedby")
-        response.raise_for_status()
+        response = fetch(OWNEDBY_URL)
 
         # Parse JSON response
         data = response.json()
 
         if save_to_file:
-            # Sort data by key and prepare for saving
-            sorted_data = {
-                str(k): v
-                for k, v in sorted(data["data"].items(), key=lambda item: int(item[0]))
-            }
-            result = {"data": sorted_data}
-
-            # Save the processed JSON data to a file
-            with open("ownedby.json", "w", encoding="utf-8") as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-
+            return save_ownedby(data)
         else:
-            # Create a mapping from the retrieved data
-            mapping = {}
-            for key, value in data.get("data", {}).items():
-                mapping[value["name"]] = int(key)
-            return mapping
+            return build_channel_id_mapping(data)
 
     except requests.ConnectionError as e:
         raise requests.ConnectionError(f"Connection error occurred: {e}")
@@ -114,7 +199,116 @@ def get_channel_id_mapping(save_to_file: bool = False) -> Dict:
         raise RuntimeError(f"Data processing error: {e}") from e
 
 
-def load_yaml_from_directory(directory_path: str, file_name: str = None) -> dict:
+def save_ownedby(data: Dict, file_path: str = "ownedby.json") -> Dict:
+    """
+    Sort ownedby data by numeric id and save it to a JSON file.
+
+    Parameters:
+    data (dict): The ownedby payload, with entries under "data" keyed by id.
+    file_path (str): Where to save the sorted data.
+
+    Returns:
+    dict: The sorted ownedby data.
+    """
+    # Sort data by key and prepare for saving
+    sorted_data = {
+        str(k): v
+        for k, v in sorted(data["data"].items(), key=lambda item: int(item[0]))
+    }
+    result = {"data": sorted_data}
+
+    # Save the processed JSON data to a file
+    write_json_artifact(file_path, result)
+
+    remember_channel_id_mapping(result)
+    return result
+
+
+def build_channel_id_mapping(data: Dict) -> Dict[str, int]:
+    """
+    Create a mapping of channel names to IDs from ownedby data.
+
+    Parameters:
+    data (dict): The ownedby payload, with entries under "data" keyed by id.
+
+    Returns:
+    dict: A mapping of channel names to IDs.
+    """
+    mapping = {}
+    for key, value in data.get("data", {}).items():
+        mapping[value["name"]] = int(key)
+    return mapping
+
+
+def remember_channel_id_mapping(data: Dict, fetched_at: float = None) -> Dict[str, int]:
+    """
+    Memoize the channel id mapping of freshly fetched ownedby data, in process
+    and in the on-disk cache.
+
+    Parameters:
+    data (dict): The ownedby payload, with entries under "data" keyed by id.
+    fetched_at (float): When the data was fetched (default: now).
+
+    Returns:
+    dict: A mapping of channel names to IDs.
+    """
+    global _channel_id_mapping
+
+    mapping = build_channel_id_mapping(data)
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    with _channel_id_mapping_lock:
+        _channel_id_mapping = (fetched_at, mapping)
+        try:
+            os.makedirs(os.path.dirname(CHANNEL_ID_MAPPING_CACHE), exist_ok=True)
+            with open(CHANNEL_ID_MAPPING_CACHE, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"fetched_at": fetched_at, "data": mapping}, f, ensure_ascii=False
+                )
+        except OSError as e:
+            print(f"无法写入渠道 ID 映射缓存: {e}")
+    return mapping
+
+
+def get_cached_channel_id_mapping(
+    ttl: float = CHANNEL_ID_MAPPING_TTL,
+) -> Dict[str, int]:
+    """
+    Return the channel id mapping, hitting the network only when no copy younger
+    than `ttl` exists.
+
+    Lookup order: the process-wide memo, the on-disk cache, and finally the
+    ownedby API. The age is the `fetched_at` stored with the cache. The mtime of
+    ownedby.json is no use: the file is tracked in git, so a fresh checkout
+    makes stale data look new.
+
+    Parameters:
+    ttl (float): Maximum age in seconds of a cached mapping.
+
+    Returns:
+    dict: A mapping of channel names to IDs.
+    """
+    global _channel_id_mapping
+
+    now = time.time()
+    with _channel_id_mapping_lock:
+        if _channel_id_mapping is not None and now - _channel_id_mapping[0] <= ttl:
+            return _channel_id_mapping[1]
+
+        try:
+            with open(CHANNEL_ID_MAPPING_CACHE, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if now - cached["fetched_at"] <= ttl:
+                _channel_id_mapping = (cached["fetched_at"], cached["data"])
+                return cached["data"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    return remember_channel_id_mapping(fetch(OWNEDBY_URL).json())
+
+
+def load_yaml_from_directory(
+    directory_path: str, file_name: str = None, workers: int = None
+) -> dict:
     """
     Load and merge YAML files from a directory, handling duplicates and ensuring
     'oaklight-load-balancer.yaml' is applied last. If `file_name` is provided,
@@ -123,6 +317,8 @@ def load_yaml_from_directory(directory_path: str, file_name: str = None) -> dict
     Args:
         directory_path (str): Path to the directory containing YAML files.
         file_name (str, optional): Specific file name to process.
+        workers (int, optional): Number of processes to parse the files with
+            (default: $YAML_WORKERS). Files are always merged in order here.
 
     Returns:
         dict: Merged YAML data.
@@ -130,26 +326,46 @@ def load_yaml_from_directory(directory_path: str, file_name: str = None) -> dict
         FileNotFoundError: If the specified file_name does not exist.
     """
     yaml_data = {"models": {}}
-    special_file = "oaklight-load-balancer.yaml"
 
     # 如果提供了 file_name，则只处理这个文件
     if file_name:
-        file_path = os.path.join(directory_path, file_name)
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(
-                f"The specified file '{file_name}' does not exist in the directory: {directory_path}"
-            )
-        with open(file_path, "r", encoding="utf-8") as file:
-            file_data = yaml.safe_load(file)
+        file_data = _parse_yaml_file(_single_yaml_file(directory_path, file_name))
         if "models" in file_data:
             yaml_data["models"] = file_data["models"]
         return yaml_data
 
     # 原有逻辑，只处理目录中的所有 YAML 文件
+    filenames = list_yaml_files(directory_path)
+    file_paths = [os.path.join(directory_path, filename) for filename in filenames]
+    parsed = _map_files(_parse_yaml_file, file_paths, workers)
+
+    # 按覆盖顺序合并解析结果
+    for filename, file_data in zip(filenames, parsed):
+        print(f"Processing file: {filename}")  # Debug print
+        if "models" in file_data:
+            merge_channel_models(yaml_data["models"], file_data["models"])
+
+    # print(yaml_data["models"]["OpenRouter"])
+    return yaml_data
+
+
+def list_yaml_files(directory_path: str) -> List[str]:
+    """
+    List the YAML files of a directory in override order: sorted by name, with
+    'oaklight-load-balancer.yaml' last.
+
+    Args:
+        directory_path (str): Path to the directory containing YAML files.
+
+    Returns:
+        List[str]: File names in the order they should be applied.
+    """
+    special_file = "oaklight-load-balancer.yaml"
     files_to_process = []
 
     # 收集除特殊文件之外的所有 yaml 文件
-    for filename in os.listdir(directory_path):
+    all_files = os.listdir(directory_path)
+    for filename in all_files:
         if filename.endswith(".yaml") and filename != special_file:
             files_to_process.append(filename)
 
@@ -157,30 +373,62 @@ def load_yaml_from_directory(directory_path: str, file_name: str = None) -> dict
     files_to_process.sort()
 
     # 如果存在特殊文件，则把它放在最后处理
-    if special_file in os.listdir(directory_path):
+    if special_file in all_files:
         files_to_process.append(special_file)
 
-    # 处理收集到的每个文件
-    for filename in files_to_process:
-        print(f"Processing file: {filename}")  # Debug print
-        file_path = os.path.join(directory_path, filename)
-        with open(file_path, "r", encoding="utf-8") as file:
-            file_data = yaml.safe_load(file)
-            if "models" in file_data:
-                for channel, models in file_data["models"].items():
-                    # 如果模型列表为空，跳过更新
-                    if not models:
-                        print(f"Skipping empty model list for channel: {channel}")
-                        continue
-                    if channel in yaml_data["models"]:
-                        # 更新已存在的模型，覆盖重复项
-                        for model_name, model_info in models.items():
-                            yaml_data["models"][channel][model_name] = model_info
-                    else:
-                        yaml_data["models"][channel] = models
+    return files_to_process
+
+
+def merge_channel_models(merged: dict, file_models: dict) -> dict:
+    """
+    Merge the per-channel models of one file into `merged`, later files
+    overriding models of the same name. Empty model lists are skipped.
+
+    Args:
+        merged (dict): Models merged so far, keyed by channel; updated in place.
+        file_models (dict): The "models" mapping of the next file.
+
+    Returns:
+        dict: `merged`.
+    """
+    for channel, models in file_models.items():
+        # 如果模型列表为空，跳过更新
+        if not models:
+            print(f"Skipping empty model list for channel: {channel}")
+            continue
+        if channel in merged:
+            # 更新已存在的模型，覆盖重复项
+            for model_name, model_info in models.items():
+                merged[channel][model_name] = model_info
+        else:
+            merged[channel] = dict(models)
+    return merged
+
+
+def _single_yaml_file(directory_path: str, file_name: str) -> str:
+    file_path = os.path.join(directory_path, file_name)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(
+            f"The specified file '{file_name}' does not exist in the directory: {directory_path}"
+        )
+    return file_path
+
+
+def _parse_yaml_file(file_path: str) -> dict:
+    with open(file_path, "r", encoding="utf-8") as file:
+        return yaml.load(file, Loader=yaml_loader())
 
-    # print(yaml_data["models"]["OpenRouter"])
-    return yaml_data
+
+def _map_files(func, items: list, workers: int = None) -> list:
+    """Apply `func` to every item, in a process pool if more than one worker is asked for."""
+    workers = YAML_WORKERS if workers is None else workers
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, items))
 
 
 def split_price_string(price_str: str) -> Tuple[float, str]:
@@ -195,9 +443,7 @@ def split_price_string(price_str: str) -> Tuple[float, str]:
     :param price_str: The input price string
     :return: Tuple of (numeric_value, text_part)
     """
-    import re
-
-    match = re.match(r"^([\d.]+)\s*(.*)$", price_str.strip())
+    match = PRICE_PATTERN.match(price_str.strip())
     if not match:
         raise ValueError(f"Invalid price format: {price_str}")
     return (float(match.group(1)), match.group(2))
@@ -241,6 +487,13 @@ def convert_price(price_str: str) -> Tuple[float, str]:
     Raises:
         ValueError: If the input string format is invalid.
     """
+    # The same few price strings recur across the catalog, memoize on the
+    # stripped string
+    return _convert_normalized_price(price_str.strip())
+
+
+@lru_cache(maxsize=4096)
+def _convert_normalized_price(price_str: str) -> Tuple[float, str]:
     # Split into numeric value and text part
     try:
         numeric_value, text_part = split_price_string(price_str)
@@ -317,44 +570,250 @@ def process_extra_ratios(
 def create_model_entry(
     model_name, model_type, channel_type, input_price, output_price, extra_ratios=None
 ):
-    """创建模型条目字典。"""
-    entry = {
-        "model": model_name,
-        "type": model_type,
-        "channel_type": channel_type,
-        "input": round_to_five(input_price),
-        "output": round_to_five(output_price),
-    }
+    """创建模型条目。"""
+    fields = (
+        model_name,
+        model_type,
+        channel_type,
+        round_to_five(input_price),
+        round_to_five(output_price),
+    )
     if extra_ratios:
-        entry["extra_ratios"] = process_extra_ratios(
-            extra_ratios, input_price, output_price
+        return PriceEntry(
+            *fields, process_extra_ratios(extra_ratios, input_price, output_price)
         )
-    return entry
+    return PriceEntry(*fields)
 
 
-def yaml_to_json(directory_path: str, file_name: str = None) -> dict:
+def compile_model_entries(model_name: str, model_info: dict) -> List[PriceEntry]:
+    """
+    Convert one manual price model, and each of its aliases, into price entries.
+
+    The entries' channel_type is left as None; it is filled in by yaml_to_json.
+
+    Args:
+        model_name (str): Model name.
+        model_info (dict): The model's YAML data (input, output, type, aliases, extra_ratios).
+
+    Returns:
+        List[PriceEntry]: The model entry followed by one entry per alias.
+    """
+    # 转换价格（处理可能缺失的input/output字段）
+    input_price, input_price_type = (
+        convert_price(str(model_info["input"]))
+        if "input" in model_info
+        else (0, "times")
+    )
+    output_price, output_price_type = (
+        convert_price(str(model_info["output"]))
+        if "output" in model_info
+        else (0, "times")
+    )
+
+    if (input_price != 0 and input_price_type == "times") or (
+        output_price != 0 and output_price_type == "times"
+    ):
+        model_type_default = "times"
+    else:
+        model_type_default = "tokens"
+
+    # 如果模型提供了type，则使用模型信息。否则使用默认值。
+    model_type = model_info.get("type", model_type_default)
+
+    # 添加主模型条目
+    entry = create_model_entry(
+        model_name,
+        model_type,
+        None,
+        input_price,
+        output_price,
+        model_info.get("extra_ratios", None),
+    )
+    entries = [entry]
+
+    # 如果存在别名，则为每个别名添加条目
+    if "aliases" in model_info:
+        aliases = model_info["aliases"]
+        # 兼容旧格式（逗号分隔字符串）和新格式（列表）
+        if isinstance(aliases, str):
+            aliases = [alias.strip() for alias in aliases.split(",")]
+        for alias in aliases:
+            # 别名与主模型价格相同，复用已转换的条目（包括共享的 extra_ratios）
+            entries.append(entry.replace(model=alias.strip()))
+
+    return entries
+
+
+def compile_file_models(file_models: dict) -> dict:
+    """
+    Compile the "models" mapping of one YAML file into price entries.
+
+    Args:
+        file_models (dict): Models keyed by channel, then by model name.
+
+    Returns:
+        dict: The same shape with each model's YAML data replaced by its entries.
+        Empty channels are kept as they are.
+    """
+    compiled = {}
+    for channel, models in file_models.items():
+        if not models:
+            compiled[channel] = models
+            continue
+        compiled[channel] = {
+            model_name: compile_model_entries(model_name, model_info)
+            for model_name, model_info in models.items()
+        }
+    return compiled
+
+
+MANUAL_CATALOG_CACHE = os.path.join(".cache", "manual_prices.pickle")
+MANUAL_CATALOG_VERSION = 2  # bump whenever the price conversion changes
+
+# process-wide copy of the compiled catalog cache: {file path: {"sha256", "models"}}
+_manual_catalog = None
+_manual_catalog_lock = threading.Lock()
+
+
+def _load_manual_catalog() -> Dict[str, dict]:
+    global _manual_catalog
+    if _manual_catalog is None:
+        try:
+            with open(MANUAL_CATALOG_CACHE, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") != MANUAL_CATALOG_VERSION:
+                raise ValueError("outdated manual price catalog cache")
+            _manual_catalog = cached["files"]
+        except (OSError, ValueError, KeyError, pickle.UnpicklingError, EOFError):
+            _manual_catalog = {}
+    return _manual_catalog
+
+
+def _save_manual_catalog() -> None:
+    try:
+        os.makedirs(os.path.dirname(MANUAL_CATALOG_CACHE), exist_ok=True)
+        tmp_path = f"{MANUAL_CATALOG_CACHE}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {"version": MANUAL_CATALOG_VERSION, "files": _manual_catalog},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, MANUAL_CATALOG_CACHE)
+    except OSError as e:
+        print(f"无法写入手工价格缓存: {e}")
+
+
+def _compile_yaml_content(content: bytes) -> dict:
+    file_data = yaml.load(content.decode("utf-8"), Loader=yaml_loader()) or {}
+    return compile_file_models(file_data.get("models") or {})
+
+
+def load_compiled_files(file_paths: List[str], workers: int = None) -> List[dict]:
+    """
+    Return the compiled "models" of YAML files, re-parsing only those whose
+    content hash differs from the cached one.
+
+    Args:
+        file_paths (List[str]): Paths to the YAML files.
+        workers (int, optional): Number of processes to parse changed files with
+            (default: $YAML_WORKERS).
+
+    Returns:
+        List[dict]: Compiled models of each file, as returned by compile_file_models.
+    """
+    contents = []
+    for file_path in file_paths:
+        with open(file_path, "rb") as f:
+            contents.append(f.read())
+    digests = [hashlib.sha256(content).hexdigest() for content in contents]
+    keys = [os.path.abspath(file_path) for file_path in file_paths]
+
+    with _manual_catalog_lock:
+        catalog = _load_manual_catalog()
+        compiled = []
+        for key, digest in zip(keys, digests):
+            cached = catalog.get(key)
+            hit = cached is not None and cached["sha256"] == digest
+            compiled.append(cached["models"] if hit else None)
+
+    stale = [i for i, models in enumerate(compiled) if models is None]
+    if not stale:
+        return compiled
+
+    with span("parse", source="manual_prices"):
+        fresh = _map_files(_compile_yaml_content, [contents[i] for i in stale], workers)
+    with _manual_catalog_lock:
+        catalog = _load_manual_catalog()
+        for i, models in zip(stale, fresh):
+            compiled[i] = models
+            catalog[keys[i]] = {"sha256": digests[i], "models": models}
+        _save_manual_catalog()
+    return compiled
+
+
+def load_compiled_catalog(
+    directory_path: str, file_name: str = None, workers: int = None
+) -> dict:
+    """
+    Load manual price entries keyed by channel and model name, with the same
+    override rules as load_yaml_from_directory.
+
+    Args:
+        directory_path (str): Path to the directory containing YAML files.
+        file_name (str, optional): Specific file name to process.
+        workers (int, optional): Number of processes to parse changed files with
+            (default: $YAML_WORKERS).
+
+    Returns:
+        dict: Price entries keyed by channel, then by model name.
+    Raises:
+        FileNotFoundError: If the specified file_name does not exist.
+    """
+    if file_name:
+        return load_compiled_files([_single_yaml_file(directory_path, file_name)])[0]
+
+    filenames = list_yaml_files(directory_path)
+    file_paths = [os.path.join(directory_path, filename) for filename in filenames]
+
+    catalog = {}
+    for filename, models in zip(filenames, load_compiled_files(file_paths, workers)):
+        print(f"Processing file: {filename}")  # Debug print
+        merge_channel_models(catalog, models)
+    return catalog
+
+
+def yaml_to_json(
+    directory_path: str, file_name: str = None, workers: int = None
+) -> dict:
     """
     Convert YAML data in a directory to JSON format, handling aliases and price conversion.
     If `file_name` is specified, only process that YAML file.
 
+    Files are compiled once and cached by content hash (see load_compiled_files),
+    so only changed files are parsed and converted again.
+
     Args:
         directory_path (str): Path to the directory containing YAML files.
         file_name (str, optional): Specific file name to process.
+        workers (int, optional): Number of processes to parse changed files with
+            (default: $YAML_WORKERS).
 
     Returns:
         dict: Converted JSON data.
     """
 
-    # 根据 file_name 参数加载 YAML 数据
-    yaml_data = load_yaml_from_directory(directory_path, file_name)
+    # 根据 file_name 参数加载编译后的价格条目
+    catalog = load_compiled_catalog(directory_path, file_name, workers)
 
-    # 获取渠道 ID 映射关系
-    channel_id_mapping = get_channel_id_mapping()
+    # 获取渠道 ID 映射关系（优先使用缓存）
+    channel_id_mapping = get_cached_channel_id_mapping()
 
     json_data = {"data": []}
+    aliases = 0
 
     # 遍历每个渠道及其模型
-    for channel_type, models in yaml_data["models"].items():
+    for channel_type, models in catalog.items():
         new_channel_type = channel_id_mapping.get(channel_type, channel_type)
         if new_channel_type is None:
             print(f"未找到 {channel_type} 对应的渠道 ID，将保留原始值。")
@@ -362,72 +821,76 @@ def yaml_to_json(directory_path: str, file_name: str = None) -> dict:
         if models is None or len(models) == 0:
             print(f"渠道 {channel_type} 没有模型，跳过。")
             continue
-        # 遍历每个模型及其信息
-        for model_name, model_info in models.items():
-            # 转换价格（处理可能缺失的input/output字段）
-            input_price, input_price_type = (
-                convert_price(str(model_info["input"]))
-                if "input" in model_info
-                else (0, "times")
-            )
-            output_price, output_price_type = (
-                convert_price(str(model_info["output"]))
-                if "output" in model_info
-                else (0, "times")
-            )
+        # 遍历每个模型的条目（主模型及别名）
+        for entries in models.values():
+            aliases += len(entries) - 1
+            for entry in entries:
+                json_data["data"].append(entry.replace(channel_type=new_channel_type))
 
-            if (input_price != 0 and input_price_type == "times") or (
-                output_price != 0 and output_price_type == "times"
-            ):
-                model_type_default = "times"
-            else:
-                model_type_default = "tokens"
-
-            # 如果模型提供了type，则使用模型信息。否则使用默认值。
-            model_type = model_info.get("type", model_type_default)
-
-            # 添加主模型条目
-            json_data["data"].append(
-                create_model_entry(
-                    model_name,
-                    model_type,
-                    new_channel_type,
-                    input_price,
-                    output_price,
-                    model_info.get("extra_ratios", None),
-                )
-            )
+    inc("aliases_expanded", aliases, source=file_name or directory_path)
+    return json_data
 
-            # 如果存在别名，则为每个别名添加条目
-            if "aliases" in model_info:
-                aliases = model_info["aliases"]
-                # 兼容旧格式（逗号分隔字符串）和新格式（列表）
-                if isinstance(aliases, str):
-                    aliases = [alias.strip() for alias in aliases.split(",")]
-                for alias in aliases:
-                    json_data["data"].append(
-                        create_model_entry(
-                            alias.strip(),
-                            model_type,
-                            new_channel_type,
-                            input_price,
-                            output_price,
-                            # 确保别名也包含额外的比率信息
-                            model_info.get("extra_ratios", None),
-                        )
-                    )
 
-    return json_data
+def price_sort_key(item: PriceEntry) -> Tuple:
+    """Sort key of a price entry: channel_type (primary) and model (secondary)."""
+    if type(item) is PriceEntry:
+        return (item.channel_type, item.model)
+    return (item["channel_type"], item["model"])
 
 
 # Function to sort the prices list based on channel_type (primary) and model (secondary)
 def sort_prices(prices: dict) -> dict:
-    prices["data"] = sorted(
-        prices["data"], key=lambda x: (x["channel_type"], x["model"])
-    )
+    prices["data"] = sorted(prices["data"], key=price_sort_key)
     return prices
 
 
+def _sorted_entries(entries) -> list:
+    """Return the entries sorted by price_sort_key, reusing the list if it already is."""
+    entries = entries if isinstance(entries, list) else list(entries)
+    keys = [price_sort_key(item) for item in entries]
+    if all(keys[i] <= keys[i + 1] for i in range(len(keys) - 1)):
+        return entries
+    return sorted(entries, key=price_sort_key)
+
+
+def merge_price_sources(*sources: dict, label: str = "merged") -> dict:
+    """
+    Merge price sources given in order of precedence into one sorted,
+    deduplicated price list.
+
+    For every (model, channel_type) the entry of the first source that has it
+    wins, and within a source its first entry wins. Sources that are already
+    sorted are merged as they are, others are sorted first, and the sorted
+    sources are combined with a k-way heap merge. The inputs are not modified.
+
+    Args:
+        *sources (dict): Price data ({"data": [...]}), highest precedence first.
+            "data" may be any iterable of entries.
+        label (str, optional): Value of the "merge" label of the span and of
+            the rows_overridden counter, to tell the merges of a run apart.
+
+    Returns:
+        dict: The merged price data, sorted by channel_type and model.
+    """
+    merged = []
+    last_key = None
+    overridden = 0
+    with span("merge", merge=label):
+        # heapq.merge is stable: on equal keys, entries of earlier sources come first
+        for item in heapq.merge(
+            *(_sorted_entries(source["data"]) for source in sources),
+            key=price_sort_key,
+        ):
+            key = price_sort_key(item)
+            if key != last_key:
+                merged.append(item)
+                last_key = key
+            else:
+                overridden += 1
+    inc("rows_overridden", overridden, merge=label)
+    return {"data": merged}
+
+
 # Updated integrate_prices function to include sorting
 def integrate_prices(primary_prices: dict, secondary_prices: dict) -> dict:
     # 创建一个字典，用于快速查找 primary_prices 中的条目，键为 (model, channel_type) 元组
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# the scripts in src/ import each other as top-level modules
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+)
+
+import artifacts  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory with a fresh process-wide digest store."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(artifacts, "_default_store", None)
+    return tmp_path
@@ -0,0 +1,63 @@
+import os
+
+from artifacts import (
+    DigestStore,
+    PriceArtifact,
+    write_json_artifact,
+    write_price_artifacts,
+    write_price_shards,
+)
+
+PRICES = {
+    "data": [
+        {"model": "a", "type": "tokens", "channel_type": 1, "input": 1, "output": 2},
+        {"model": "b", "type": "tokens", "channel_type": 2, "input": 3, "output": 4},
+    ]
+}
+
+
+def _restored_store(workdir) -> DigestStore:
+    """The digest store as a new run finds it in the restored .cache."""
+    return DigestStore(str(workdir / ".cache" / "digests.json"))
+
+
+def test_first_write_is_a_change(workdir):
+    store = _restored_store(workdir)
+    assert write_json_artifact("ownedby.json", {"data": {}}, store=store)
+    assert store.changed == {"ownedby.json"}
+
+
+def test_missing_file_with_matching_digest_is_not_changed(workdir):
+    write_json_artifact("ownedby.json", {"data": {}}, store=_restored_store(workdir))
+    os.remove("ownedby.json")
+
+    store = _restored_store(workdir)
+    assert not write_json_artifact("ownedby.json", {"data": {}}, store=store)
+    assert os.path.exists("ownedby.json")
+    assert store.changed == set()
+
+    assert write_json_artifact("ownedby.json", {"data": {"1": {}}}, store=store)
+    assert store.changed == {"ownedby.json"}
+
+
+def test_missing_price_files_with_matching_digests_are_not_changed(workdir):
+    artifacts = [
+        PriceArtifact("oneapi_prices.json"),
+        PriceArtifact("only_1.json", lambda row: row["channel_type"] == 1),
+    ]
+    write_price_artifacts(PRICES, artifacts, store=_restored_store(workdir))
+    write_price_shards(PRICES, store=_restored_store(workdir))
+    for path in ("oneapi_prices.json", "only_1.json", "shards/1.json"):
+        os.remove(path)
+
+    store = _restored_store(workdir)
+    changed = write_price_artifacts(PRICES, artifacts, store=store)
+    write_price_shards(PRICES, store=store)
+    assert changed == {"oneapi_prices.json": False, "only_1.json": False}
+    assert os.path.exists("oneapi_prices.json") and os.path.exists("shards/1.json")
+    assert store.changed == set()
+
+    # a change to channel 2 leaves the channel 1 subset unchanged
+    prices = {"data": PRICES["data"][:1] + [dict(PRICES["data"][1], input=5)]}
+    changed = write_price_artifacts(prices, artifacts, store=store)
+    assert changed == {"oneapi_prices.json": True, "only_1.json": False}
@@ -0,0 +1,76 @@
+import json
+import shutil
+
+import pytest
+
+import artifacts
+import merge_prices
+import utils
+from price_delta import apply_price_delta
+
+
+def _row(model, channel_type, input_price, output_price):
+    return {
+        "model": model,
+        "type": "tokens",
+        "channel_type": channel_type,
+        "input": input_price,
+        "output": output_price,
+    }
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    monkeypatch.setattr(utils, "get_cached_channel_id_mapping", lambda *_: {})
+
+
+def _publish(run_dir, monkeypatch, upstream_rows, restore_from=None):
+    """
+    Run the merge stage in an empty `run_dir` holding only what the workflow
+    restores from the prices branch of the run in `restore_from`.
+    """
+    run_dir.mkdir()
+    if restore_from is not None:
+        shutil.copy(restore_from / "oneapi_prices.json", run_dir)
+        shutil.copytree(restore_from / "deltas", run_dir / "deltas")
+    (run_dir / "manual_prices").mkdir()
+    monkeypatch.chdir(run_dir)
+    monkeypatch.setattr(artifacts, "_default_store", None)
+    merge_prices.merge_prices(
+        {"data": []}, {"data": []}, upstream_prices={"data": upstream_rows}
+    )
+    with open(run_dir / "deltas" / "index.json", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_deltas_continue_from_the_restored_snapshot(workdir, offline, monkeypatch):
+    first = [_row("a", 1, 1, 2), _row("b", 1, 3, 4)]
+    second = [_row("a", 1, 1, 2), _row("b", 1, 5, 6), _row("c", 2, 1, 1)]
+    third = [_row("b", 1, 5, 6), _row("c", 2, 1, 1)]
+
+    index = _publish(workdir / "run1", monkeypatch, first)
+    assert index["sequence"] == 1 and index["deltas"] == []
+
+    index = _publish(workdir / "run2", monkeypatch, second, workdir / "run1")
+    assert index["sequence"] == 2
+    assert [entry["file"] for entry in index["deltas"]] == ["2.json"]
+
+    index = _publish(workdir / "run3", monkeypatch, third, workdir / "run2")
+    assert index["sequence"] == 3
+    assert [entry["file"] for entry in index["deltas"]] == ["2.json", "3.json"]
+
+    # a client holding the first snapshot catches up with the kept deltas
+    with open(workdir / "run1" / "oneapi_prices.json", encoding="utf-8") as f:
+        rows = json.load(f)["data"]
+    for entry in index["deltas"]:
+        with open(workdir / "run3" / "deltas" / entry["file"], encoding="utf-8") as f:
+            rows = apply_price_delta(rows, json.load(f))
+    with open(workdir / "run3" / "oneapi_prices.json", encoding="utf-8") as f:
+        assert rows == json.load(f)["data"]
+
+
+def test_unchanged_prices_keep_the_sequence(workdir, offline, monkeypatch):
+    rows = [_row("a", 1, 1, 2)]
+    _publish(workdir / "run1", monkeypatch, rows)
+    index = _publish(workdir / "run2", monkeypatch, rows, workdir / "run1")
+    assert index["sequence"] == 1 and index["deltas"] == []
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from price_entry import PriceEntry, as_price_entries, freeze_ratios
+
+
+def test_equal_ratios_are_shared():
+    assert freeze_ratios({"shared": 2}) is freeze_ratios({"shared": 2})
+
+
+def test_ratios_of_different_types_are_not_shared():
+    assert json.dumps(freeze_ratios({"typed": 1})) == '{"typed": 1}'
+    assert json.dumps(freeze_ratios({"typed": 1.0})) == '{"typed": 1.0}'
+    assert json.dumps(freeze_ratios({"typed": True})) == '{"typed": true}'
+
+    rows = [
+        {
+            "model": model,
+            "type": "tokens",
+            "channel_type": 1,
+            "input": 1,
+            "output": 1,
+            "extra_ratios": {"cached": ratio},
+        }
+        for model, ratio in (("a", 1), ("b", 1.0))
+    ]
+    entries = [PriceEntry.from_dict(row) for row in rows]
+    assert [entry.to_dict() for entry in entries] == rows
+    assert json.dumps(entries[1]["extra_ratios"]) == '{"cached": 1.0}'
+
+
+def test_rows_missing_a_field_are_skipped(caplog):
+    rows = [
+        {"model": "a", "type": "tokens", "channel_type": 1, "input": 1, "output": 2},
+        {"model": "b", "type": "tokens", "channel_type": 1, "input": 1},
+        {"model": "c", "type": "tokens", "channel_type": 1, "input": 3, "output": 4},
+    ]
+    with pytest.raises(ValueError, match="'b' has no 'output'"):
+        PriceEntry.from_dict(rows[1])
+    entries = list(as_price_entries(rows))
+    assert [entry["model"] for entry in entries] == ["a", "c"]
+    assert "'b' has no 'output'" in caplog.text
@@ -0,0 +1,29 @@
+import threading
+
+import sync_targets
+from sync_targets import OneHubTarget, fan_out
+
+
+def test_timed_out_sync_is_not_started_again_while_running():
+    target = OneHubTarget("http://straggler.invalid", "token", "straggler")
+    release = threading.Event()
+    calls = []
+
+    def slow_sync(target):
+        calls.append(target.name)
+        release.wait(5)
+        return "synced"
+
+    _, failed = fan_out([target], slow_sync, timeout=0.05)
+    assert isinstance(failed["straggler"], TimeoutError)
+
+    # a retry while the first sync still runs leaves the instance alone
+    _, failed = fan_out([target], slow_sync, timeout=0.05)
+    assert isinstance(failed["straggler"], RuntimeError)
+    assert calls == ["straggler"]
+
+    release.set()
+    sync_targets._stragglers[target.url].result(5)
+    results, failed = fan_out([target], slow_sync, timeout=5)
+    assert results == {"straggler": "synced"} and not failed
+    assert calls == ["straggler", "straggler"]